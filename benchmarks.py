@@ -0,0 +1,322 @@
+"""
+Benchmarks for the performance-sensitive parts of the code; these are not tests, they print timings.
+
+Usage: python benchmarks.py [name ...]  (without names, all benchmarks are run)
+"""
+
+import sys
+from time import perf_counter
+
+from dsn.s_expr.clef import Note, BecomeAtom, SetAtom, BecomeList, Insert
+from dsn.s_expr.utils import bubble_history_up
+from filehandler import all_notes_from_buffer, all_notes_from_stream
+from type_factories import HASH_ALGORITHMS
+from vlq import to_vlq, to_vlqs, from_vlq_buffer, from_vlqs
+
+
+def example_notes(n, depth=3):
+    """A synthetic history of (approximately) n notes: a spine of nested lists, at the bottom of which atoms are
+    inserted and edited."""
+    spine = [0] * depth
+
+    notes = [BecomeList()]
+    for d in range(depth):
+        notes.append(bubble_history_up(Insert(0, BecomeList()), None, spine[:d]))
+
+    children = 0
+    while len(notes) < n:
+        if children > 0 and len(notes) % 3 == 0:
+            note = bubble_history_up(SetAtom("edited-%s" % len(notes)), None, spine + [children - 1])
+        else:
+            note = bubble_history_up(Insert(children, BecomeAtom("atom-%s" % len(notes))), None, spine)
+            children += 1
+        notes.append(note)
+
+    return notes
+
+
+def timed(description, f, *args):
+    start = perf_counter()
+    result = f(*args)
+    print("%-60s %8.3fs" % (description, perf_counter() - start))
+    return result
+
+
+def bench_decoding():
+    notes = example_notes(50000, depth=10)
+    data = b"".join(note.as_bytes() for note in notes)
+    print("Decoding %s notes (%s bytes)" % (len(notes), len(data)))
+
+    timed("Note.from_stream (iterator over bytes)", lambda: list(all_notes_from_stream(iter(data))))
+    timed("Note.from_buffer (memoryview with offsets)", lambda: list(all_notes_from_buffer(memoryview(data))))
+
+
+def bench_vlq():
+    integers = list(range(0, 10 ** 7, 37))
+    print("Encoding and decoding %s integers" % len(integers))
+
+    timed("to_vlq, one integer at a time", lambda: b"".join(to_vlq(i) for i in integers))
+    encoded = timed("to_vlqs, batched", to_vlqs, integers)
+
+    def one_at_a_time():
+        offset, result = 0, []
+        while offset < len(encoded):
+            value, offset = from_vlq_buffer(encoded, offset)
+            result.append(value)
+        return result
+
+    timed("from_vlq_buffer, one integer at a time", one_at_a_time)
+    timed("from_vlqs, batched", from_vlqs, encoded)
+
+
+def bench_hashing():
+    from dsn.s_expr.construct import play_score
+    from dsn.s_expr.score import Score
+    from memoization import Memoization
+
+    notes = example_notes(2000, depth=30)
+    print("Slurring and playing %s notes of depth 30" % len(notes))
+
+    # To compare with the situation without cached serializations, we temporarily swap out the caching as_bytes. N.B.
+    # play_score slurs the notes onto the Score of each node they're played on, i.e. each level of a note is serialized
+    # (and hashed) once for each of its ancestors.
+    cached_as_bytes = Note.as_bytes
+    Note.as_bytes = lambda note: note._as_bytes()
+    timed("sha256, slur, serialization not cached", Score.empty().slur_many, notes)
+    timed("sha256, play_score, serialization not cached", play_score, Memoization(), Score.from_list(notes))
+    Note.as_bytes = cached_as_bytes
+
+    for algorithm in sorted(HASH_ALGORITHMS):
+        Score.empty(algorithm).slur_many(notes)  # fills the serialization-cache, and makes sure scores are interned
+        timed("%s, slur, serialization cached" % algorithm, Score.empty(algorithm).slur_many, notes)
+        timed("%s, play_score, serialization cached" % algorithm, play_score, Memoization(),
+              Score.from_list(notes, algorithm))
+
+
+def bench_children():
+    from pvector import PVector
+    from list_operations import l_insert, l_replace, l_delete
+
+    n, edits = 10000, 5000
+    print("%s edits (insert, replace, delete) on a list of %s children" % (edits, n))
+
+    def edit(children):
+        versions = []  # like the memoization, we keep all versions around
+        for i in range(edits):
+            index = (i * 7919) % len(children)
+            children = l_insert(children, index, i)
+            children = l_replace(children, index, -i)
+            children = l_delete(children, (index * 31) % len(children))
+            versions.append(children)
+        return versions
+
+    timed("plain python lists", edit, list(range(n)))
+    timed("PVector", edit, PVector(range(n)))
+
+
+def bench_spacetime():
+    from spacetime import st_become, st_insert, st_delete
+
+    n = 10000
+    print("%s insertions and %s deletions (at pseudo-random positions) in t2s/s2t" % (n, n // 2))
+
+    def edit(t2s, s2t):
+        for i in range(n):
+            t2s, s2t = st_insert(t2s, s2t, (i * 7919) % (len(s2t) + 1))
+            if i % 2 == 1:
+                t2s, s2t = st_delete(t2s, s2t, (i * 31) % len(s2t))
+        return t2s, s2t
+
+    timed("plain python lists", edit, [], [])
+    timed("T2S/S2T (PVector-backed)", edit, *st_become())
+
+    # Inserting repeatedly in the same gap (e.g. typing in the middle of a list) is the worst case for labels that are
+    # bisected on insertion; the relabeling keeps them bounded.
+    def edit_in_gap(t2s, s2t):
+        for i in range(n * 2):
+            t2s, s2t = st_insert(t2s, s2t, min(len(s2t), 5))
+        return t2s, s2t
+
+    print("%s insertions (in the same gap) in t2s/s2t, and %s lookups by t" % (n * 2, n))
+    t2s, s2t = timed("T2S/S2T (PVector-backed), insertions", edit_in_gap, *st_become())
+    timed("T2S/S2T (PVector-backed), lookups", lambda: [t2s[(t * 7919) % len(t2s)] for t in range(n)])
+
+
+def bench_nerdspace():
+    from nerdspace import sn_become, sn_insert, sn_delete
+
+    n = 10000
+    print("%s insertions and %s deletions (at pseudo-random positions) in n2s/s2n" % (n, n // 2))
+
+    def edit(n2s, s2n):
+        for i in range(n):
+            n2s, s2n, _ = sn_insert(n2s, s2n, (i * 7919) % (len(s2n) + 1))
+            if i % 2 == 1:
+                n2s, s2n, _ = sn_delete(n2s, s2n, (i * 31) % len(s2n))
+        return n2s, s2n
+
+    timed("plain python lists", edit, [], [])
+    timed("N2S/S2N (WeightedPVector-backed)", edit, *sn_become())
+
+
+def bench_deep():
+    # N.B. the cost per note is dominated by the hashing of the note's levels onto the scores of each node in the spine,
+    # which is inherently quadratic in the depth.
+    from dsn.s_expr.construct import play_note
+    from dsn.s_expr import nerd
+
+    for depth in [10, 100, 1000]:
+        notes = example_notes(depth + 1 + 200, depth=depth)
+
+        def play(play_note, notes):
+            tree = None
+            for note in notes:
+                tree = play_note(note, tree)
+            return tree
+
+        # The spine is created first; the timed part is: the 200 notes at the bottom of the spine.
+        tree = play(play_note, notes[:depth + 1])
+        nerd_tree = play(nerd.play_note, notes[:depth + 1])
+
+        start = perf_counter()
+        for note in notes[depth + 1:]:
+            tree = play_note(note, tree)
+        per_note = (perf_counter() - start) / 200
+
+        start = perf_counter()
+        for note in notes[depth + 1:]:
+            nerd_tree = nerd.play_note(note, nerd_tree)
+        nerd_per_note = (perf_counter() - start) / 200
+
+        print("depth %5s: play_note %8.3fms per note; nerd.play_note %8.3fms per note" % (
+            depth, per_note * 1000, nerd_per_note * 1000))
+
+
+def bench_pp():
+    # The pp tree (and from it: the iri tree) is reconstructed after each edit; in the incremental version only the
+    # spine of the edited node is.
+    from dsn.s_expr.construct import play_note
+    from dsn.pp.construct import construct_pp_tree
+    from dsn.pp.in_context import construct_iri_top_down, InheritedRenderingInformation, IriAnnotatedSExpr
+    from dsn.pp.in_context import MULTI_LINE_ALIGNED
+    from dsn.pp.structure import PPAnnotationTrie
+
+    notes = example_notes(3000, depth=3)
+    tree = None
+    for note in notes[:2000]:
+        tree = play_note(note, tree)
+
+    def edit(incremental):
+        t, pp_tree, pp_annotations = tree, None, PPAnnotationTrie()
+        for note in notes[2000:]:
+            t = play_note(note, t)
+            pp_tree = construct_pp_tree(t, pp_annotations, pp_tree if incremental else None, pp_annotations)
+            construct_iri_top_down(pp_tree, InheritedRenderingInformation(MULTI_LINE_ALIGNED), IriAnnotatedSExpr)
+        return pp_tree
+
+    print("construct_pp_tree & construct_iri_top_down after each of %s edits (in a tree of ~%s nodes)" % (
+        len(notes) - 2000, 2000))
+    timed("from scratch", edit, False)
+    timed("incremental", edit, True)
+
+
+def bench_replay():
+    from dsn.s_expr.construct import play_score
+    from dsn.s_expr.score import Score
+    from memoization import Memoization
+
+    score = Score.from_list(example_notes(20000, depth=3))
+    print("Cold replay of a history of %s notes" % len(score))
+
+    for memoize_every in [1, 16, 64, 256]:
+        timed("play_score, memoize_every=%s" % memoize_every, play_score, Memoization(), score, memoize_every)
+
+
+def bench_memory():
+    import tracemalloc
+    from dsn.s_expr.construct import play_score
+    from dsn.s_expr import nerd
+    from dsn.s_expr.score import Score
+    from memoization import Memoization, Unbounded
+
+    score = Score.from_list(example_notes(10000, depth=3))
+
+    def distinct_nodes(trees):
+        seen = set()
+        todo = list(trees)
+        while todo:
+            node = todo.pop()
+            if id(node) not in seen:
+                seen.add(id(node))
+                todo.extend(getattr(node, 'children', []))
+        return len(seen)
+
+    # The scores are created up front: they are shared by all constructions, and not what we're measuring here.
+    print("Memory retained by the memoized constructions of a history of %s notes" % len(score))
+
+    for description, cache_name, play in [
+            ("construct.play_score", 'construct', play_score),
+            ("nerd.play_score", 'construct_nerd', nerd.play_score)]:
+        m = Memoization()
+        m.set_policy(cache_name, Unbounded())  # i.e. all versions are kept
+        tracemalloc.start()
+        play(m, score)
+        retained, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        nodes = distinct_nodes(getattr(m, cache_name).data.values())
+        print("%-40s %8.1f MB; %7s nodes; %6.0f bytes per node" % (
+            description, retained / 2 ** 20, nodes, retained / nodes))
+
+
+def bench_type_checks():
+    # The type checks are switched on or off at import-time (see utils.TYPE_CHECKS); hence: a fresh process for each.
+    import os
+    import subprocess
+
+    code = "\n".join([
+        "from time import perf_counter",
+        "from benchmarks import example_notes",
+        "from dsn.s_expr.construct import play_score",
+        "from dsn.s_expr.score import Score",
+        "from memoization import Memoization",
+        "score = Score.from_list(example_notes(20000, depth=3))",
+        "start = perf_counter()",
+        "play_score(Memoization(), score)",
+        "print(perf_counter() - start)",
+    ])
+
+    print("Cold replay of a history of 20000 notes")
+    timings = {}
+    for value in ["1", "0"]:
+        output = subprocess.check_output([sys.executable, "-c", code], env=dict(os.environ, NERF1_TYPE_CHECKS=value))
+        timings[value] = float(output)
+        print("%-60s %8.3fs" % ("play_score, NERF1_TYPE_CHECKS=%s" % value, timings[value]))
+
+    print("Share of the type checks: %.0f%%" % (100 * (timings["1"] - timings["0"]) / timings["1"]))
+
+
+BENCHMARKS = {
+    'children': bench_children,
+    'deep': bench_deep,
+    'decoding': bench_decoding,
+    'hashing': bench_hashing,
+    'memory': bench_memory,
+    'nerdspace': bench_nerdspace,
+    'pp': bench_pp,
+    'replay': bench_replay,
+    'spacetime': bench_spacetime,
+    'type_checks': bench_type_checks,
+    'vlq': bench_vlq,
+}
+
+
+def main(names):
+    for name in (names or sorted(BENCHMARKS)):
+        print("## %s" % name)
+        BENCHMARKS[name]()
+        print()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,13 +1,62 @@
 from utils import pmts
+from collections.abc import Sequence
 
 
 class EICHStructure(object):
     """EICH means: Edit In-Context History"""
 
     def __init__(self, score, items, cursor, tree_t_address, expanded_chords):
-        pmts(items, list)
+        pmts(items, Sequence)  # e.g. a list, or lazily rendered items
         self.score = score
         self.items = items
         self.cursor = cursor
         self.tree_t_address = tree_t_address
         self.expanded_chords = expanded_chords
+
+
+class LazyItems(Sequence):
+    """The items of an in-context history, rendered on demand.
+
+    What's known up front (i.e. without rendering) is how many items there are, and to which note in the local score
+    each of them belongs; the actual rendering happens per note, the first time one of its items is accessed.
+
+    >>> items = LazyItems(['a', 'b', 'c0', 'c1'], [0, 1, 2, 2], lambda k: ["rendered %s" % k, "rendered %s'" % k])
+    >>> len(items), items[1], items[-1]
+    (4, 'rendered 1', "rendered 2'")
+    >>> items.rendered
+    {1: ['rendered 1', "rendered 1'"], 2: ['rendered 2', "rendered 2'"]}
+    >>> items[1:3]
+    ['rendered 1', 'rendered 2']
+    """
+
+    def __init__(self, note_addresses=(), note_indices=(), items_for_note=None):
+        # per item: the address of the note that's rendered by it, and the index in the local score of the note of
+        # which the item is (part of) the rendering.
+        self.note_addresses = list(note_addresses)
+        self.note_indices = list(note_indices)
+
+        self.items_for_note = items_for_note
+        self.rendered = {}  # index in the local score => the items for that note
+
+        self.first_item_for_note = {}
+        for i, k in enumerate(self.note_indices):
+            self.first_item_for_note.setdefault(k, i)
+
+    def __len__(self):
+        return len(self.note_addresses)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+
+        if not (0 <= index < len(self)):
+            raise IndexError("LazyItems index out of range")
+
+        k = self.note_indices[index]
+        if k not in self.rendered:
+            self.rendered[k] = self.items_for_note(k)
+
+        return self.rendered[k][index - self.first_item_for_note[k]]
@@ -1,6 +1,4 @@
-from utils import pmts
-from spacetime import get_s_address_for_t_address
-from s_address import node_for_s_address
+from utils import pmts, pmts_or_none
 
 from dsn.s_expr.nerd import NerdSExpr, get_n_address_for_t_address, node_for_n_address
 
@@ -8,63 +6,92 @@ from dsn.s_expr.structure import Atom
 from dsn.s_expr.nerd import NerdAtom
 
 from dsn.pp.structure import PPNone, PPSingleLine, PPMultiLineAligned, PPMultiLineIndented
-from dsn.pp.structure import PPAnnotatedSExpr, PPAnnotatedNerdSExpr
+from dsn.pp.structure import PPAnnotatedSExpr, PPAnnotatedNerdSExpr, PPAnnotationTrie
 from dsn.pp.clef import PPUnset, PPSetSingleLine, PPSetMultiLineAligned, PPSetMultiLineIndented
 
 
-def build_annotated_tree(node, default_annotation):
-    if isinstance(node, Atom):
-        annotated_children = []
-    else:
-        annotated_children = [build_annotated_tree(child, default_annotation) for child in node.children]
+def _pp_annotation_for_note(pp_note):
+    if isinstance(pp_note, PPUnset):
+        return PPNone()
+    elif isinstance(pp_note, PPSetSingleLine):
+        return PPSingleLine()
+    elif isinstance(pp_note, PPSetMultiLineAligned):
+        return PPMultiLineAligned()
+    elif isinstance(pp_note, PPSetMultiLineIndented):
+        return PPMultiLineIndented()
+    raise Exception("Unknown PP Note")
 
-    return PPAnnotatedSExpr(
-        node,
-        default_annotation,
-        annotated_children,
-    )
 
+def _as_trie(pp_annotations):
+    # pp_annotations used to be a plain list of annotations; such lists are still accepted.
+    if isinstance(pp_annotations, list):
+        return PPAnnotationTrie.from_annotations(pp_annotations)
 
-def construct_pp_tree(tree, pp_annotations):
+    pmts_or_none(pp_annotations, PPAnnotationTrie)
+    return pp_annotations
+
+
+def construct_pp_tree(tree, pp_annotations, previous_pp_tree=None, previous_pp_annotations=None):
     """Because pp notes take a t_address, they can be applied on future trees (i.e. the current tree).
 
-    The better (more general, more elegant and more performant) solution is to build the pp_tree in sync with the
-    general tree, and have construct_pp_tree be a function over notes from those clefs rather than on trees.
+    pp_annotations is a PPAnnotationTrie (or a list of annotations, which is converted to one), which we walk down in
+    sync with the tree.
+
+    The construction is incremental: given the pp_tree which was previously constructed (for any tree, and for
+    `previous_pp_annotations`), its annotated subtrees are reused for those nodes that are unchanged (by identity, which
+    is meaningful because of hash-consing, see dsn.s_expr.construct) at the same t_address, as long as no pp_annotations
+    were made inside them (again: by identity, of the subtries). I.e. for a typical edit only the spine of the edited
+    node is reconstructed. Reuse requires both previous_pp_tree and previous_pp_annotations; given only the former, the
+    pp_tree is constructed from scratch.
     """
-    annotated_tree = build_annotated_tree(tree, PPNone())
+    pp_annotations = _as_trie(pp_annotations)
+    pmts(pp_annotations, PPAnnotationTrie)
+    previous_pp_annotations = _as_trie(previous_pp_annotations)
 
-    for annotation in pp_annotations:
-        pp_note = annotation.annotation
+    if previous_pp_annotations is None:
+        # Without knowing what annotations previous_pp_tree reflects, there is nothing we can safely reuse.
+        previous_pp_tree = None
 
-        s_address = get_s_address_for_t_address(tree, pp_note.t_address)
-        if s_address is None:
-            # the node either:
-            # * no longer exists
-            # * doesn't exist yet (when future pp_annotations are applied on a tree from the past)
-            continue
+    return _construct_pp_node(tree, pp_annotations, previous_pp_tree, previous_pp_annotations)
 
-        if isinstance(pp_note, PPUnset):
-            new_value = PPNone()
-        elif isinstance(pp_note, PPSetSingleLine):
-            new_value = PPSingleLine()
-        elif isinstance(pp_note, PPSetMultiLineAligned):
-            new_value = PPMultiLineAligned()
-        elif isinstance(pp_note, PPSetMultiLineIndented):
-            new_value = PPMultiLineIndented()
-        else:
-            raise Exception("Unknown PP Note")
-
-        annotated_node = node_for_s_address(annotated_tree, s_address)
-        # let's just do this mutably first... this is the lazy approach (but that fits with the caveats mentioned at the
-        # top of this method)
-        annotated_node.annotation = new_value
 
-    return annotated_tree
+def _construct_pp_node(node, pp_annotations, previous, previous_pp_annotations):
+    # pp_annotations: the subtrie for the t_address of node
+    # previous: the annotated node for the same t_address in the previous pp_tree (or None if there is none)
 
+    if previous is not None and previous.underlying_node is node and pp_annotations is previous_pp_annotations:
+        return previous
 
-def build_annotated_nerd_tree(node, default_annotation):
-    # NOTE: copy-pasted from construct_pp_tree, with small modifactions.
+    if pp_annotations.annotation is not None:
+        annotation = _pp_annotation_for_note(pp_annotations.annotation.annotation)
+    else:
+        annotation = PPNone()
+
+    if isinstance(node, Atom):
+        return PPAnnotatedSExpr(node, annotation, [])
 
+    # The previous annotated children, by t_index (i.e. matched on identity in time rather than position in space)
+    previous_children = {}
+    if previous is not None and not isinstance(previous.underlying_node, Atom):
+        previous_children = dict(zip(previous.underlying_node.s2t, previous.children))
+
+    annotated_children = []
+    for t_index, child in zip(node.s2t, node.children):
+        previous_child = previous_children.get(t_index)
+        previous_child_pp_annotations = None
+        if previous_child is not None:
+            previous_child_pp_annotations = previous_pp_annotations.children.get(t_index, PPAnnotationTrie.EMPTY)
+
+        annotated_children.append(_construct_pp_node(
+            child,
+            pp_annotations.children.get(t_index, PPAnnotationTrie.EMPTY),
+            previous_child,
+            previous_child_pp_annotations))
+
+    return PPAnnotatedSExpr(node, annotation, annotated_children)
+
+
+def build_annotated_nerd_tree(node, default_annotation):
     if isinstance(node, NerdAtom):
         annotated_children = []
     else:
@@ -78,36 +105,29 @@ def build_annotated_nerd_tree(node, default_annotation):
 
 
 def construct_pp_nerd_tree(tree, pp_annotations):
-    # NOTE: copy-pasted from construct_pp_tree, with small modifactions.
+    # NOTE: similar to construct_pp_tree, but non-incremental (the nerd trees are constructed fresh for each rendering
+    # anyway)
 
     pmts(tree, NerdSExpr)
+    pp_annotations = _as_trie(pp_annotations)
+    pmts(pp_annotations, PPAnnotationTrie)
     annotated_tree = build_annotated_nerd_tree(tree, PPNone())
 
-    for annotation in pp_annotations:
+    for t_address, annotation in pp_annotations.items():
         pp_note = annotation.annotation
 
-        n_address = get_n_address_for_t_address(tree, pp_note.t_address)
+        n_address = get_n_address_for_t_address(tree, t_address)
         if n_address is None:
             # the node either:
             # * no longer exists
             # * doesn't exist yet (when future pp_annotations are applied on a tree from the past)
             continue
 
-        if isinstance(pp_note, PPUnset):
-            new_value = PPNone()
-        elif isinstance(pp_note, PPSetSingleLine):
-            new_value = PPSingleLine()
-        elif isinstance(pp_note, PPSetMultiLineAligned):
-            new_value = PPMultiLineAligned()
-        elif isinstance(pp_note, PPSetMultiLineIndented):
-            new_value = PPMultiLineIndented()
-        else:
-            raise Exception("Unknown PP Note")
+        new_value = _pp_annotation_for_note(pp_note)
 
         annotated_node = node_for_n_address(annotated_tree, n_address)
 
-        # let's just do this mutably first... this is the lazy approach (but that fits with the caveats mentioned at the
-        # top of this method)
+        # let's just do this mutably first... this is the lazy approach
         annotated_node.annotation = new_value
 
     return annotated_tree
@@ -1,3 +1,5 @@
+from weakref import WeakKeyDictionary
+
 from annotated_tree import annotated_node_factory
 
 from dsn.s_expr.structure import SExpr
@@ -32,12 +34,32 @@ IriAnnotatedInContextDisplay = annotated_node_factory(
     InheritedRenderingInformation)
 
 
+# pp_annotated_node => {(inherited multiline_mode, annotated_class): the result of construct_iri_top_down}
+_constructed = WeakKeyDictionary()
+
+
 def construct_iri_top_down(pp_annotated_node, inherited_information, annotated_class):
     """Constructs the InheritedRenderingInformation in a top-down fashion. Note the difference between the PP
     instructions and the InheritedRenderingInformation: the PP instructions must be viewed in the light of their
     ancestors, the InheritedRenderingInformation can be used without such lookups in the tree, and is therefore more
     easily used. Of course, we must construct it first, which is what we do in the present function.
+
+    The results are memoized on the identity of pp_annotated_node (and on the inherited information). Because
+    construct_pp_tree reuses unchanged annotated subtrees, the same goes for the present function: after an edit only
+    the spine is constructed anew.
     """
+    key = (inherited_information.multiline_mode, annotated_class)
+    memo = _constructed.get(pp_annotated_node)
+    if memo is None:
+        memo = _constructed[pp_annotated_node] = {}
+    elif key in memo:
+        return memo[key]
+
+    memo[key] = result = _construct_iri_top_down(pp_annotated_node, inherited_information, annotated_class)
+    return result
+
+
+def _construct_iri_top_down(pp_annotated_node, inherited_information, annotated_class):
 
     # I attempted to write this more generally, as a generic map-over-trees function and a function that operates on a
     # single node; however: the fact that the index of a child is such an important piece of information (it determines
@@ -27,3 +27,98 @@ class PPMultiLineIndented(PPAnnotation):
 
 PPAnnotatedSExpr = annotated_node_factory('PPAnnotatedSExpr', SExpr, PPAnnotation)
 PPAnnotatedNerdSExpr = annotated_node_factory('PPAnnotatedNerdSExpr', NerdSExpr, PPAnnotation)
+
+
+class PPAnnotationTrie(object):
+    """The pp-annotations (annotations.Annotation objects with a PPNote as their annotation), organized as a trie on
+    their t_addresses. Only the latest annotation for any given t_address is kept, i.e. the effective one.
+
+    Immutable: adding an annotation returns a new trie, which shares all nodes with the original except for those on
+    the path to the annotated t_address. A consequence is that (for a given lineage of tries) identity of subtries
+    implies that nothing was annotated inside them.
+
+    >>> from annotations import Annotation
+    >>> from dsn.pp.clef import PPSetSingleLine, PPSetMultiLineAligned, PPUnset
+    >>> trie = PPAnnotationTrie()
+    >>> for pp_note in [PPSetSingleLine([1, 2]), PPSetMultiLineAligned([]), PPUnset([1, 2]), PPSetSingleLine([3])]:
+    ...     trie = trie.with_annotation(Annotation(None, pp_note))
+    >>> trie
+    [([], PPSetMultiLineAligned), ([1, 2], PPUnset), ([3], PPSetSingleLine)]
+
+    All annotations under a given prefix, re-rooted:
+
+    >>> trie.at([1])
+    [([2], PPUnset)]
+    >>> [a.annotation.t_address for a in trie.at([1]).annotations()]
+    [[2]]
+
+    >>> trie.at([1]) is trie.with_annotation(Annotation(None, PPSetSingleLine([3]))).at([1])
+    True
+    >>> trie.at([4, 5]) is trie.at([6]) is PPAnnotationTrie.EMPTY
+    True
+
+    From a list of annotations (the way they were stored before the trie):
+
+    >>> PPAnnotationTrie.from_annotations([Annotation(None, PPSetSingleLine([0])), Annotation(None, PPUnset([0]))])
+    [([0], PPUnset)]
+    """
+
+    __slots__ = ('annotation', 'children')
+
+    def __init__(self, annotation=None, children=None):
+        # the (latest) annotation for the t_address of this node itself, if any
+        self.annotation = annotation
+
+        # t_index => PPAnnotationTrie
+        self.children = {} if children is None else children
+
+    def __repr__(self):
+        return repr([(t_address, annotation.annotation) for t_address, annotation in self.items()])
+
+    @classmethod
+    def from_annotations(cls, annotations):
+        """From a list of annotations, in the order in which they were made (i.e. later ones overrule earlier ones)."""
+        result = cls.EMPTY
+        for annotation in annotations:
+            result = result.with_annotation(annotation)
+        return result
+
+    def with_annotation(self, annotation, _depth=0):
+        t_address = annotation.annotation.t_address
+
+        if _depth == len(t_address):
+            return PPAnnotationTrie(annotation, self.children)
+
+        t_index = t_address[_depth]
+        children = dict(self.children)
+        children[t_index] = self.children.get(t_index, PPAnnotationTrie.EMPTY).with_annotation(annotation, _depth + 1)
+        return PPAnnotationTrie(self.annotation, children)
+
+    def at(self, t_address):
+        """The subtrie for t_address; i.e. its t_addresses are relative to t_address."""
+        result = self
+        for t_index in t_address:
+            result = result.children.get(t_index, PPAnnotationTrie.EMPTY)
+
+        return result
+
+    def items(self):
+        """Yields (t_address, annotation) pairs, with t_addresses relative to the root of this (sub)trie."""
+        stack = [([], self)]
+        while stack:
+            t_address, node = stack.pop()
+
+            if node.annotation is not None:
+                yield t_address, node.annotation
+
+            for t_index in sorted(node.children, reverse=True):
+                stack.append((t_address + [t_index], node.children[t_index]))
+
+    def annotations(self):
+        """The annotations in this (sub)trie, rewritten such that their t_addresses are relative to its root."""
+        return [
+            type(annotation)(annotation.score, type(annotation.annotation)(t_address))
+            for t_address, annotation in self.items()]
+
+
+PPAnnotationTrie.EMPTY = PPAnnotationTrie()
@@ -1,6 +1,6 @@
 # coding=utf-8
-from vlq import to_vlq, from_vlq
-from utils import pmts, rfs
+from vlq import to_vlq, from_vlq, from_vlq_buffer
+from utils import pmts, rfs, rfb
 
 from dsn.s_expr.structure import Atom, List
 
@@ -16,6 +16,29 @@ CHORD = 6
 
 class Note(object):
 
+    # The serialization of the note; notes are immutable, so it's computed at most once (and for notes that are read
+    # from a buffer with keep_bytes, never: the bytes they were read from are the serialization).
+    _bytes = None
+
+    def as_bytes(self):
+        if self._bytes is None:
+            # Chains of Inserts/Extends (i.e. notes for deep trees) are serialized iteratively rather than recursively.
+            chain = []
+            note = self
+            while note._bytes is None and isinstance(note, (Insert, Extend)):
+                chain.append(note)
+                note = note.child_note
+
+            if note._bytes is None:
+                note._bytes = note._as_bytes()  # not an Insert/Extend
+
+            result = note._bytes
+            for note in reversed(chain):
+                result = note._prefix_bytes() + result
+                note._bytes = result
+
+        return self._bytes
+
     @staticmethod
     def from_stream(byte_stream):
         byte0 = next(byte_stream)
@@ -29,6 +52,31 @@ class Note(object):
             CHORD: Chord,
         }[byte0].from_stream(byte_stream)
 
+    @staticmethod
+    def from_buffer(buffer, offset, keep_bytes=False):
+        """The random-access counterpart of from_stream: reads a note from any indexable bytes-like buffer (preferably a
+        memoryview, which makes slicing copy-free) at the given offset.
+        :: buffer, offset => note, new_offset
+
+        keep_bytes: store the bytes that were read as the note's serialization, such that as_bytes() (e.g. for hashing)
+        doesn't need to recompute it."""
+        # Chains of Inserts/Extends (i.e. notes for deep trees) are read iteratively rather than recursively; the
+        # counterpart of the same in as_bytes.
+        start = offset
+        chain = []
+        while buffer[offset] in (INSERT, EXTEND):
+            NoteClass = NOTE_CLASS_FOR_BYTE[buffer[offset]]
+            index, offset = from_vlq_buffer(buffer, offset + 1)
+            chain.append((NoteClass, index))
+
+        note, end = NOTE_CLASS_FOR_BYTE[buffer[offset]].from_buffer(buffer, offset + 1)
+        for NoteClass, index in reversed(chain):
+            note = NoteClass(index, note)
+
+        if keep_bytes:
+            note._bytes = bytes(buffer[start:end])
+        return note, end
+
     @staticmethod
     def from_s_expression(s_expression):
         """In the paper "Clef Design, Thoughts on the Formalization of Program Construction" I presented a notation for
@@ -71,7 +119,7 @@ class BecomeAtom(Note):
     def __repr__(self):
         return "(become-atom " + self.atom + ")"
 
-    def as_bytes(self):
+    def _as_bytes(self):
         utf8 = self.atom.encode('utf-8')
         return bytes([BECOME_ATOM]) + to_vlq(len(utf8)) + utf8
 
@@ -81,6 +129,12 @@ class BecomeAtom(Note):
         utf8 = rfs(byte_stream, length)
         return BecomeAtom(str(utf8, 'utf-8'))
 
+    @staticmethod
+    def from_buffer(buffer, offset):
+        length, offset = from_vlq_buffer(buffer, offset)
+        utf8, offset = rfb(buffer, offset, length)
+        return BecomeAtom(str(utf8, 'utf-8')), offset
+
     def to_s_expression(self):
         return List([Atom("become-atom"), Atom(self.atom)])
 
@@ -97,7 +151,7 @@ class SetAtom(Note):
     def __repr__(self):
         return "(set-atom " + self.atom + ")"
 
-    def as_bytes(self):
+    def _as_bytes(self):
         utf8 = self.atom.encode('utf-8')
         return bytes([SET_ATOM]) + to_vlq(len(utf8)) + utf8
 
@@ -107,6 +161,12 @@ class SetAtom(Note):
         utf8 = rfs(byte_stream, length)
         return SetAtom(str(utf8, 'utf-8'))
 
+    @staticmethod
+    def from_buffer(buffer, offset):
+        length, offset = from_vlq_buffer(buffer, offset)
+        utf8, offset = rfb(buffer, offset, length)
+        return SetAtom(str(utf8, 'utf-8')), offset
+
     def to_s_expression(self):
         return List([Atom("set-atom"), Atom(self.atom)])
 
@@ -119,13 +179,17 @@ class BecomeList(Note):
     def __repr__(self):
         return "(become-list)"
 
-    def as_bytes(self):
+    def _as_bytes(self):
         return bytes([BECOME_LIST])
 
     @staticmethod
     def from_stream(byte_stream):
         return BecomeList()
 
+    @staticmethod
+    def from_buffer(buffer, offset):
+        return BecomeList(), offset
+
     def to_s_expression(self):
         return List([Atom("become-list")])
 
@@ -145,14 +209,23 @@ class Insert(Note):
     def __repr__(self):
         return "(insert " + repr(self.index) + " " + repr(self.child_note) + ")"
 
-    def as_bytes(self):
-        return bytes([INSERT]) + to_vlq(self.index) + self.child_note.as_bytes()
+    def _prefix_bytes(self):
+        return bytes([INSERT]) + to_vlq(self.index)
+
+    def _as_bytes(self):
+        return self._prefix_bytes() + self.child_note.as_bytes()
 
     @staticmethod
     def from_stream(byte_stream):
         # N.B.: The TypeConstructor byte is not repeated here; it happens before we reach this point
         return Insert(from_vlq(byte_stream), Note.from_stream(byte_stream))
 
+    @staticmethod
+    def from_buffer(buffer, offset):
+        index, offset = from_vlq_buffer(buffer, offset)
+        child_note, offset = Note.from_buffer(buffer, offset)
+        return Insert(index, child_note), offset
+
     def to_s_expression(self):
         return List([Atom("insert"), Atom(str(self.index)), self.child_note.to_s_expression()])
 
@@ -170,13 +243,18 @@ class Delete(Note):
     def __repr__(self):
         return "(delete " + repr(self.index) + ")"
 
-    def as_bytes(self):
+    def _as_bytes(self):
         return bytes([DELETE]) + to_vlq(self.index)
 
     @staticmethod
     def from_stream(byte_stream):
         return Delete(from_vlq(byte_stream))
 
+    @staticmethod
+    def from_buffer(buffer, offset):
+        index, offset = from_vlq_buffer(buffer, offset)
+        return Delete(index), offset
+
     def to_s_expression(self):
         return List([Atom("delete"), Atom(str(self.index))])
 
@@ -196,13 +274,22 @@ class Extend(Note):
     def __repr__(self):
         return "(extend " + repr(self.index) + " " + repr(self.child_note) + ")"
 
-    def as_bytes(self):
-        return bytes([EXTEND]) + to_vlq(self.index) + self.child_note.as_bytes()
+    def _prefix_bytes(self):
+        return bytes([EXTEND]) + to_vlq(self.index)
+
+    def _as_bytes(self):
+        return self._prefix_bytes() + self.child_note.as_bytes()
 
     @staticmethod
     def from_stream(byte_stream):
         return Extend(from_vlq(byte_stream), Note.from_stream(byte_stream))
 
+    @staticmethod
+    def from_buffer(buffer, offset):
+        index, offset = from_vlq_buffer(buffer, offset)
+        child_note, offset = Note.from_buffer(buffer, offset)
+        return Extend(index, child_note), offset
+
     def to_s_expression(self):
         return List([Atom("extend"), Atom(str(self.index)), self.child_note.to_s_expression()])
 
@@ -218,13 +305,18 @@ class Chord(Note):
     def __repr__(self):
         return "(chord " + repr(self.score) + ")"
 
-    def as_bytes(self):
+    def _as_bytes(self):
         return bytes([CHORD]) + self.score.as_bytes()
 
     @staticmethod
     def from_stream(byte_stream):
         return Chord(Score.from_stream(byte_stream))
 
+    @staticmethod
+    def from_buffer(buffer, offset):
+        score, offset = Score.from_buffer(buffer, offset)
+        return Chord(score), offset
+
     def to_s_expression(self):
         return List([Atom("chord"), List([c.to_s_expression() for c in self.score.notes])])
 
@@ -251,3 +343,24 @@ class Score(object):
         for i in range(length):
             notes.append(Note.from_stream(byte_stream))
         return Score(notes)
+
+    @staticmethod
+    def from_buffer(buffer, offset):
+        length, offset = from_vlq_buffer(buffer, offset)
+        notes = []
+        for i in range(length):
+            note, offset = Note.from_buffer(buffer, offset)
+            notes.append(note)
+        return Score(notes), offset
+
+
+# Looked up on each decoded note; hence constructed once, at the module level.
+NOTE_CLASS_FOR_BYTE = {
+    BECOME_ATOM: BecomeAtom,
+    SET_ATOM: SetAtom,
+    BECOME_LIST: BecomeList,
+    INSERT: Insert,
+    DELETE: Delete,
+    EXTEND: Extend,
+    CHORD: Chord,
+}
@@ -11,7 +11,7 @@ For now, this isn't pretty but it works. I'm open to a more elegant/general solu
 
 from dsn.s_expr.clef import BecomeAtom, SetAtom, BecomeList, Insert, Delete, Extend, Chord, Score as ChordScore
 from dsn.s_expr.simple_score import SimpleScore
-from dsn.s_expr.construct import play_note
+from dsn.s_expr.construct import play_note, play_notes
 from dsn.s_expr.structure import Atom, List
 
 from utils import pmts
@@ -174,8 +174,33 @@ def play_simple_score(score):
 
     pmts(score, SimpleScore)
 
+    # In the beginning, there is nothing, which we model as `None`; the intermediate trees are not needed.
+    return play_notes(score.notes(), None, ScoreClass=SimpleScore)
+
+
+def play_score_with_global_address(m, score):
+    """
+    Score => SExpr
+    The equivalent of play_simple_score(score_with_global_address(score)), but memoized and incremental.
+
+    GlobNotes themselves are not memoizable (see simple_score.py), but we don't need them to be: the annotation of each
+    note is fully determined by its position in the score. I.e. the (unannotated) score, which is memoizable, fully
+    determines the result. When the score is extended by some notes, only those notes are annotated and played.
+    """
+    pmts(score, Score)
+
     tree = None  # In the beginning, there is nothing, which we model as `None`
-    for note in score.notes():
+
+    todo = []
+    for score in score.scores():
+        if score in m.construct_global_address:
+            tree = m.construct_global_address[score]
+            break
+        todo.append(score)
+
+    for score in reversed(todo):
+        note = note_with_global_address(score.last_note(), NoteAddress((InScore(len(score) - 1),)))
         tree = play_note(note, tree, ScoreClass=SimpleScore)
+        m.construct_global_address[score] = tree
 
     return tree
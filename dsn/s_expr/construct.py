@@ -1,4 +1,7 @@
+from weakref import WeakValueDictionary
+
 from spacetime import st_become, st_insert, st_replace, st_delete
+from type_factories import DEFAULT_HASH_ALGORITHM
 from utils import pmts
 from list_operations import l_become, l_insert, l_delete, l_replace
 
@@ -6,24 +9,100 @@ from dsn.s_expr.clef import Note, BecomeAtom, SetAtom, BecomeList, Insert, Delet
 from dsn.s_expr.structure import SExpr, Atom, List
 from dsn.s_expr.score import Score
 
+# A reasonable value for play_score's memoize_every when (potentially) replaying a long history; matches the checkpoints
+# of the construct-memoization (see Memoization).
+COLD_REPLAY_MEMOIZE_EVERY = 64
+
+# Hash-consing of the constructed nodes: a node is fully determined by its score (its history), and Scores are unique
+# (see Score.glob). By handing out the already constructed node for any score we've seen before, identical histories
+# (e.g. the same atom-history inserted in many places, or a node that's re-inserted using its own score) yield the
+# identical object; which saves memory, and means that `is` can be used as a (cheap) test for equality of subtrees.
+# Like Score.glob, this is a WeakValueDictionary: nodes are only kept around as long as something else refers to them.
+constructed = WeakValueDictionary()  # Score => SExpr
+
+
+def _existing(score):
+    if not isinstance(score, Score):
+        return None  # Other ScoreClasses (i.e. SimpleScore) are not unique, and we don't try to deduplicate for them.
+    return constructed.get(score)
+
+
+def unique(structure):
+    """Returns the already constructed node with the same score as structure if there is one; structure otherwise."""
+    if not isinstance(structure.score, Score):
+        return structure
+
+    # NOTE: setdefault rather than `in` followed by lookup: in a WeakValueDictionary an entry may disappear in-between.
+    return constructed.setdefault(structure.score, structure)
 
-def play_note(note, structure, ScoreClass=Score):
+
+def play_note(note, structure, ScoreClass=Score, hash_algorithm=DEFAULT_HASH_ALGORITHM):
     """
     Plays a single note.
     :: note, node => node
+
+    hash_algorithm: the hashing algorithm of the node's score, when playing on nothing (structure is None); otherwise
+    the algorithm of the structure's score is used. (Children inherit it from their parents)
+
+    Extend-chains (such as produced by bubble_history_up) are played iteratively: we walk down the chain, play the note
+    at its bottom, and rebuild only the spine on the way back up. I.e. the depth of the tree does not translate into
+    recursion (nor into the associated limits).
+
+    Nodes are hash-consed (see `constructed`): if the resulting score has been constructed before, that's what we
+    return, without playing anything.
     """
 
+    score = _score_for(note, structure, ScoreClass, hash_algorithm)
+    existing = _existing(score)
+    if existing is not None:
+        return existing
+
+    spine = []
+    while isinstance(note, Extend):
+        if not isinstance(structure, List):
+            raise Exception("You can only %s on an existing List" % type(note).__name__)
+
+        if not (0 <= note.index <= len(structure.children) - 1):
+            raise Exception("Out of bounds: %s" % note.index)
+
+        spine.append((structure, score, note.index))
+        structure = structure.children[note.index]
+        note = note.child_note
+        score = _score_for(note, structure, ScoreClass, hash_algorithm)
+
+    result = _play_note_at(note, structure, score, ScoreClass)
+
+    for parent, score, index in reversed(spine):
+        children = l_replace(parent.children, index, result)
+        t2s, s2t = st_replace(parent.t2s, parent.s2t, index)
+        result = unique(List(children, t2s, s2t, score))
+
+    return result
+
+
+def _score_for(note, structure, ScoreClass, hash_algorithm):
     pmts(note, Note)
 
     if structure is None:
-        score = ScoreClass.empty().slur(note)
-    else:
-        pmts(structure, SExpr)
-        score = structure.score.slur(note)
+        return ScoreClass.empty(hash_algorithm).slur(note)
 
+    pmts(structure, SExpr)
+    return structure.score.slur(note)
+
+
+def _play_note_at(note, structure, score, ScoreClass):
+    """Plays a single note which is not an Extend (those are handled by play_note); score is the resulting score."""
+    existing = _existing(score)
+    if existing is not None:
+        return existing
+
+    return unique(_construct_note_at(note, structure, score, ScoreClass))
+
+
+def _construct_note_at(note, structure, score, ScoreClass):
     if isinstance(note, Chord):
         for score_note in note.score.notes:
-            structure = play_note(score_note, structure, ScoreClass=ScoreClass)
+            structure = play_note(score_note, structure, ScoreClass, score.hash_algorithm())
 
         # When constructing the result of playing a Chord by consecutively playing the notes in the Chord, we get the
         # correct s_expr back; it has however been annotated by a score that consists of the individual notes rather
@@ -56,13 +135,13 @@ def play_note(note, structure, ScoreClass=Score):
         if not (0 <= note.index <= len(structure.children)):  # insert _at_ len(..) is ok (a.k.a. append)
             raise Exception("Out of bounds: %s" % note.index)
 
-        child = play_note(note.child_note, None, ScoreClass=ScoreClass)
+        child = play_note(note.child_note, None, ScoreClass, score.hash_algorithm())
         children = l_insert(structure.children, note.index, child)
 
         t2s, s2t = st_insert(structure.t2s, structure.s2t, note.index)
         return List(children, t2s, s2t, score)
 
-    if not (0 <= note.index <= len(structure.children) - 1):  # For Delete/Extend the check is "inside bounds"
+    if not (0 <= note.index <= len(structure.children) - 1):  # For Delete the check is "inside bounds"
         raise Exception("Out of bounds: %s" % note.index)
 
     if isinstance(note, Delete):
@@ -70,19 +149,200 @@ def play_note(note, structure, ScoreClass=Score):
         t2s, s2t = st_delete(structure.t2s, structure.s2t, note.index)
         return List(children, t2s, s2t, score)
 
-    if isinstance(note, Extend):
-        child = play_note(note.child_note, structure.children[note.index], ScoreClass=ScoreClass)
-        children = l_replace(structure.children, note.index, child)
+    raise Exception("Unknown Note")
 
-        t2s, s2t = st_replace(structure.t2s, structure.s2t, note.index)
-        return List(children, t2s, s2t, score)
+
+class _TransientList(object):
+    """A List that's under construction by play_notes: mutable, and only reachable from the batch that created it.
+
+    The children are kept in a (persistent) PVector, which is updated using the regular l_* operations. Children that
+    are themselves transient are kept separately, in `thawed`, by their t-index (which, unlike the s-index, is stable
+    under insertion and deletion); they are put into the children at the moment of freezing."""
+
+    __slots__ = ('children', 't2s', 's2t', 'score', 'thawed')
+
+    def __init__(self, children, t2s, s2t, score):
+        self.children = children
+        self.t2s = t2s
+        self.s2t = s2t
+        self.score = score
+        self.thawed = {}  # t => _TransientList
+
+    def child(self, index):
+        t = self.s2t[index]
+        if t in self.thawed:
+            return self.thawed[t]
+        return self.children[index]
+
+    def set_child(self, index, child):
+        t = self.s2t[index]
+        if isinstance(child, _TransientList):
+            self.thawed[t] = child
+        else:
+            self.thawed.pop(t, None)
+            self.children = l_replace(self.children, index, child)
+
+
+def _thaw(structure):
+    if isinstance(structure, List):
+        return _TransientList(structure.children, structure.t2s, structure.s2t, structure.score)
+    return structure
+
+
+def _freeze(structure):
+    """Turns a transient structure into a regular (immutable) one; iteratively, in post-order, such that deep trees
+    don't lead to deep recursion. Only the transient parts are visited (the rest is shared)."""
+    if not isinstance(structure, _TransientList):
+        return structure
+
+    frozen = {}  # id(transient) => frozen version
+    stack = [(structure, False)]
+    while stack:
+        node, children_done = stack.pop()
+        if not children_done:
+            stack.append((node, True))
+            stack.extend((child, False) for child in node.thawed.values())
+            continue
+
+        children = node.children
+        for t, child in node.thawed.items():
+            children = l_replace(children, node.t2s[t], frozen.pop(id(child)))
+
+        frozen[id(node)] = unique(List(children, node.t2s, node.s2t, node.score))
+
+    return frozen[id(structure)]
+
+
+def _play_note_transient(note, structure, ScoreClass, hash_algorithm):
+    """Like play_note, but on transient structures: the Lists on the path of the note are thawed (if they aren't
+    already) and then changed in place."""
+
+    result = structure
+    parent, parent_index = None, None
+
+    while isinstance(note, Extend):
+        structure = _thaw(structure)
+        if not isinstance(structure, _TransientList):
+            raise Exception("You can only %s on an existing List" % type(note).__name__)
+
+        if not (0 <= note.index <= len(structure.children) - 1):
+            raise Exception("Out of bounds: %s" % note.index)
+
+        structure.score = structure.score.slur(note)
+
+        if parent is None:
+            result = structure
+        else:
+            parent.set_child(parent_index, structure)
+
+        parent, parent_index = structure, note.index
+        structure = structure.child(note.index)
+        note = note.child_note
+
+    played = _play_note_at_transient(note, structure, ScoreClass, hash_algorithm)
+
+    if parent is None:
+        return played
+
+    parent.set_child(parent_index, played)
+    return result
+
+
+def _play_note_at_transient(note, structure, ScoreClass, hash_algorithm):
+    pmts(note, Note)
+    score = (ScoreClass.empty(hash_algorithm) if structure is None else structure.score).slur(note)
+
+    # A transient structure which is replaced by an existing (frozen) node is simply dropped.
+    existing = _existing(score)
+    if existing is not None:
+        return existing
+
+    if isinstance(note, Chord):
+        for score_note in note.score.notes:
+            structure = _play_note_transient(score_note, structure, ScoreClass, score.hash_algorithm())
+
+        if isinstance(structure, _TransientList):
+            structure.score = score
+            return structure
+        return unique(structure.rescore(score))
+
+    if isinstance(note, BecomeAtom):
+        if structure is not None:
+            raise Exception("You can only BecomeAtom out of nothingness")
+
+        return unique(Atom(note.atom, score))
+
+    if isinstance(note, SetAtom):
+        if not isinstance(structure, Atom):
+            raise Exception("You can only SetAtom on an existing Atom")
+
+        return unique(Atom(note.atom, score))
+
+    if isinstance(note, BecomeList):
+        if structure is not None:
+            raise Exception("You can only BecomeList out of nothingness")
+
+        t2s, s2t = st_become()
+        return _TransientList(l_become(), t2s, s2t, score)
+
+    structure = _thaw(structure)
+    if not isinstance(structure, _TransientList):
+        raise Exception("You can only %s on an existing List" % type(note).__name__)
+
+    if isinstance(note, Insert):
+        if not (0 <= note.index <= len(structure.children)):  # insert _at_ len(..) is ok (a.k.a. append)
+            raise Exception("Out of bounds: %s" % note.index)
+
+        child = _play_note_transient(note.child_note, None, ScoreClass, score.hash_algorithm())
+
+        # A transient child is inserted as-is, as a placeholder; its frozen version replaces it when freezing.
+        structure.children = l_insert(structure.children, note.index, child)
+        structure.t2s, structure.s2t = st_insert(structure.t2s, structure.s2t, note.index)
+        if isinstance(child, _TransientList):
+            structure.thawed[structure.s2t[note.index]] = child
+        structure.score = score
+        return structure
+
+    if not (0 <= note.index <= len(structure.children) - 1):  # For Delete the check is "inside bounds"
+        raise Exception("Out of bounds: %s" % note.index)
+
+    if isinstance(note, Delete):
+        structure.thawed.pop(structure.s2t[note.index], None)
+        structure.children = l_delete(structure.children, note.index)
+        structure.t2s, structure.s2t = st_delete(structure.t2s, structure.s2t, note.index)
+        structure.score = score
+        return structure
 
     raise Exception("Unknown Note")
 
 
-def play_score(m, score):
-    """Constructs an SExpr by playing the full score."""
+def play_notes(notes, structure, ScoreClass=Score, hash_algorithm=DEFAULT_HASH_ALGORITHM):
+    """
+    Plays a sequence of notes; the result is the same as that of consecutive calls to play_note, but the intermediate
+    results are not constructed: the notes are applied on a transient (mutable) working copy of the parts of the tree
+    that they touch, which is frozen once, at the end. I.e. the spine from the root to the changed node is not rebuilt
+    for every note, nor are the intermediate versions of the nodes on it.
+    :: [note], node => node
+
+    hash_algorithm: as in play_note.
+    """
+    if structure is not None:
+        pmts(structure, SExpr)
+
+    for note in notes:
+        structure = _play_note_transient(note, structure, ScoreClass, hash_algorithm)
+
+    return _freeze(structure)
+
+
+def play_score(m, score, memoize_every=1):
+    """Constructs an SExpr by playing the full score.
+
+    memoize_every: the intermediate results are only memoized for every so many scores (by length; the result itself is
+    always memoized). For values > 1, the notes in between are played using play_notes, which is what makes cold
+    replays of long histories cheaper."""
     pmts(score, Score)
+    hash_algorithm = score.hash_algorithm()
 
     tree = None  # In the beginning, there is nothing, which we model as `None`
 
@@ -93,8 +353,32 @@ def play_score(m, score):
             break
         todo.append(score)
 
-    for score in reversed(todo):
-        tree = play_note(score.last_note(), tree)
+    todo.reverse()
+
+    batch = []
+    for i, score in enumerate(todo):
+        batch.append(score)
+        if len(score) % memoize_every != 0 and i != len(todo) - 1:
+            continue
+
+        if len(batch) == 1:
+            tree = play_note(score.last_note(), tree, hash_algorithm=hash_algorithm)
+        else:
+            tree = play_notes([s.last_note() for s in batch], tree, hash_algorithm=hash_algorithm)
+
         m.construct[score] = tree
+        batch = []
+
+    return tree
+
 
+def apply_note(m, structure, note):
+    """Plays a single note on top of an already constructed structure, and memoizes the result. The result is the same
+    as that of play_score(m, structure.score.slur(note)), but none of the history is looked up: when we have the
+    previous tree in hand (i.e. when editing) the cost of a note does not depend on the length of the history or the
+    size of the memoization.
+    :: m, node, note => node
+    """
+    tree = play_note(note, structure)
+    m.construct[tree.score] = tree
     return tree
@@ -13,10 +13,11 @@ In the present version we deal with 2 problems at once:
 * Tracking of is_inserted & is_deleted; which is required for in-context rendering.
 """
 
-from nerdspace import sn_become, sn_insert, sn_delete, sn_replace
-from utils import pmts
+from nerdspace import sn_become, sn_from_lists, sn_insert, sn_delete, sn_replace
+from type_factories import DEFAULT_HASH_ALGORITHM
+from utils import pmts, TYPE_CHECKS
 from list_operations import l_become, l_insert, l_replace
-from spacetime import st_insert
+from spacetime import st_become, st_insert
 
 from dsn.s_expr.structure import SExpr, Atom
 from dsn.s_expr.clef import Note, BecomeAtom, SetAtom, BecomeList, Insert, Delete, Extend, Chord
@@ -38,6 +39,9 @@ def plusminus(is_inserted, is_deleted):
 
 # ## Structure
 class NerdSExpr(object):
+    # Like SExpr: many (memoized) instances; hence slots.
+    __slots__ = ('__weakref__',)
+
     def __init__(self, *args, **kwargs):
         raise TypeError("NerdSExpr is Abstract; use NerdList or NerdAtom instead")
 
@@ -56,11 +60,13 @@ class NerdSExpr(object):
 
 
 class NerdAtom(NerdSExpr):
+    __slots__ = ('atom', 'versions', 'is_deleted', 'score')
 
     def __init__(self, atom, versions, is_deleted, score=None):
-        pmts(atom, str)
-        pmts(versions, list)
-        pmts(is_deleted, bool)
+        if TYPE_CHECKS:
+            pmts(atom, str)
+            pmts(versions, list)
+            pmts(is_deleted, bool)
 
         self.atom = atom
 
@@ -97,6 +103,7 @@ class NerdAtom(NerdSExpr):
 
 
 class NerdList(NerdSExpr):
+    __slots__ = ('children', 'n2s', 's2n', 'n2t', 't2n', 'is_inserted', 'is_deleted', 'score')
 
     def __init__(self, children, n2s, s2n, n2t, t2n, is_inserted, is_deleted, score=None):
         """
@@ -116,7 +123,8 @@ class NerdList(NerdSExpr):
         self.n2t = n2t
         self.t2n = t2n
 
-        assert len(n2t) == len(n2s)
+        if TYPE_CHECKS and len(n2t) != len(n2s):
+            raise AssertionError("n2t and n2s must be of equal length")
 
         self.is_inserted = is_inserted
         self.is_deleted = is_deleted
@@ -129,10 +137,12 @@ class NerdList(NerdSExpr):
         # form: the mapping between them is 1 to 1
         # Because N = S, we can assign s2t to n2t and t2s to t2n
 
+        n2s, s2n = sn_from_lists(list(range(len(s_expr.children))), list(range(len(s_expr.children))))
+
         return NerdList(
             children        = [NerdSExpr.from_s_expr(child) for child in s_expr.children],
-            n2s             = [i for i in range(len(s_expr.children))],
-            s2n             = [i for i in range(len(s_expr.children))],
+            n2s             = n2s,
+            s2n             = s2n,
             n2t             = s_expr.s2t,
             t2n             = s_expr.t2s,
             is_inserted     = False,
@@ -172,23 +182,64 @@ class NerdList(NerdSExpr):
 
 
 # ## Construction
-def play_note(note, structure, ScoreClass=Score):
+def play_note(note, structure, ScoreClass=Score, hash_algorithm=DEFAULT_HASH_ALGORITHM):
     """
     Plays a single note.
     :: note, s_expr => s_expr
+
+    Like construct.play_note, Extend-chains are played iteratively (walking down, then rebuilding the spine); and
+    hash_algorithm is as in construct.play_note too.
     """
 
+    spine = []
+    while isinstance(note, Extend):
+        score = _score_for(note, structure, ScoreClass, hash_algorithm)
+
+        if not isinstance(structure, NerdList):
+            raise Exception("You can only %s on an existing NerdList" % type(note).__name__)
+
+        if not (0 <= note.index <= len(structure.s2n) - 1):
+            raise Exception("Out of bounds: %s" % note.index)
+
+        n2s, s2n, index = sn_replace(structure.n2s, structure.s2n, note.index)
+        spine.append((structure, score, n2s, s2n, index))
+        structure = structure.children[index]
+        note = note.child_note
+
+    result = _play_note_at(note, structure, ScoreClass, hash_algorithm)
+
+    for parent, score, n2s, s2n, index in reversed(spine):
+        result = NerdList(
+            children        = l_replace(parent.children, index, result),
+            n2s             = n2s,
+            s2n             = s2n,
+            n2t             = parent.n2t,
+            t2n             = parent.t2n,
+            is_inserted     = parent.is_inserted,
+            is_deleted      = parent.is_deleted,
+            score           = score
+            )
+
+    return result
+
+
+def _score_for(note, structure, ScoreClass, hash_algorithm):
     pmts(note, Note)
 
     if structure is None:
-        score = ScoreClass.empty().slur(note)
-    else:
-        pmts(structure, NerdSExpr)
-        score = structure.score.slur(note)
+        return ScoreClass.empty(hash_algorithm).slur(note)
+
+    pmts(structure, NerdSExpr)
+    return structure.score.slur(note)
+
+
+def _play_note_at(note, structure, ScoreClass, hash_algorithm):
+    """Plays a single note which is not an Extend (those are handled by play_note)."""
+    score = _score_for(note, structure, ScoreClass, hash_algorithm)
 
     if isinstance(note, Chord):
         for score_note in note.score.notes:
-            structure = play_note(score_note, structure, ScoreClass)
+            structure = play_note(score_note, structure, ScoreClass, score.hash_algorithm())
         return structure.rescore(score)
 
     if isinstance(note, BecomeAtom):
@@ -208,13 +259,14 @@ def play_note(note, structure, ScoreClass=Score):
             raise Exception("You can only BecomeList out of nothingness")
 
         n2s, s2n = sn_become()
+        t2n, n2t = st_become()
 
         return NerdList(
             children        = l_become(),
             n2s             = n2s,
             s2n             = s2n,
-            n2t             = [],
-            t2n             = [],
+            n2t             = n2t,
+            t2n             = t2n,
             is_inserted     = True,
             is_deleted      = False,
             score           = score
@@ -227,7 +279,7 @@ def play_note(note, structure, ScoreClass=Score):
         if not (0 <= note.index <= len(structure.s2n)):  # insert _at_ len(..) is ok (a.k.a. append)
             raise Exception("Out of bounds: %s" % note.index)
 
-        child = play_note(note.child_note, None, ScoreClass)
+        child = play_note(note.child_note, None, ScoreClass, score.hash_algorithm())
 
         n2s, s2n, index = sn_insert(structure.n2s, structure.s2n, note.index)
         t2n, n2t = st_insert(structure.t2n, structure.n2t, index)
@@ -245,31 +297,13 @@ def play_note(note, structure, ScoreClass=Score):
             score           = score,
             )
 
-    if not (0 <= note.index <= len(structure.s2n) - 1):  # For Delete/Extend the check is "inside bounds"
+    if not (0 <= note.index <= len(structure.s2n) - 1):  # For Delete the check is "inside bounds"
         raise Exception("Out of bounds: %s" % note.index)
 
     if isinstance(note, Delete):
         n2s, s2n, index = sn_delete(structure.n2s, structure.s2n, note.index)
 
-        children = structure.children[:]
-        children[index] = children[index].deleted_version()
-
-        return NerdList(
-            children        = children,
-            n2s             = n2s,
-            s2n             = s2n,
-            n2t             = structure.n2t,
-            t2n             = structure.t2n,
-            is_inserted     = structure.is_inserted,
-            is_deleted      = structure.is_deleted,
-            score           = score
-            )
-
-    if isinstance(note, Extend):
-        n2s, s2n, index = sn_replace(structure.n2s, structure.s2n, note.index)
-
-        child = play_note(note.child_note, structure.children[index], ScoreClass)
-        children = l_replace(structure.children, index, child)
+        children = l_replace(structure.children, index, structure.children[index].deleted_version())
 
         return NerdList(
             children        = children,
@@ -299,7 +333,7 @@ def play_score(m, score):
         todo.append(score)
 
     for score in reversed(todo):
-        tree = play_note(score.last_note(), tree)
+        tree = play_note(score.last_note(), tree, hash_algorithm=score.hash_algorithm())
         m.construct_nerd[score] = tree
 
     return tree
@@ -1,3 +1,6 @@
+from weakref import WeakValueDictionary
+
+from type_factories import DEFAULT_HASH_ALGORITHM, check_hash_algorithm
 from dsn.s_expr.legato import NoteCapo, NoteSlur, NoteNoutHash
 
 PMM = "I understand that this is protected"
@@ -25,20 +28,42 @@ class Score(object):
     Second, Hashes make for an easy implementation of deduplication/uniqueness guarantee, and for cheap lookups (i.e.
     when using the score as a key in a memoization table).
 
-    TODO: The uniqueness guarantee is currently implemented using "cache everything forever"; if the present solution
-    ever makes it to some kind of "production editor" we should rethink this, i.e. use the appropriate dict from
-    `weakref` (and think through and test whether this actually means unused lists will be collected)
+    The uniqueness guarantee is implemented using a WeakValueDictionary: a Score is only kept around as long as
+    something refers to it. To make sure a Score's predecessors (which are referred to by hash in the nouts) remain
+    available as long as the Score itself is alive, each Score also has a direct reference to its predecessor. In other
+    words: branches of history that are no longer referred to (e.g. abandoned undo-paths, or temporary scores) are
+    collected; the history of what's still referred to is not.
+
+    Besides the link to its predecessor, each Score has a "jump" link to some further ancestor. The jumps are laid out
+    as in a skew-binary random access list (Myers, "An applicative random-access stack", 1983), which gives O(log n)
+    access to any ancestor (`ancestor(length)`), and O(log n) lowest common ancestors (`common_ancestor(other)`).
     """
 
-    glob = {}
+    glob = WeakValueDictionary()
 
-    def __init__(self, nout, hash_, len_, poor_mans_protected):
+    # There's a Score for every version of every node; __weakref__ is needed for glob.
+    __slots__ = ('__nout', '__hash', '__len', '__previous', '__jump', '__weakref__')
+
+    def __init__(self, nout, hash_, len_, previous, poor_mans_protected):
         if poor_mans_protected != PMM:
             raise Exception("Instantiate NoteList using empty() or slur(note) rather than directly.")
 
         self.__nout = nout
         self.__hash = hash_
         self.__len = len_
+        self.__previous = previous  # a "strong" link backwards; `None` for the empty Score
+
+        # The jump-link: if the previous score's jump spans as many scores as the jump after it, we jump over both of
+        # them (making the jumps 2 * span + 1 long); otherwise we jump to our predecessor.
+        if previous is None:
+            self.__jump = None
+        else:
+            jump = previous.__jump
+            if jump is not None and jump.__jump is not None and \
+                    previous.__len - jump.__len == jump.__len - jump.__jump.__len:
+                self.__jump = jump.__jump
+            else:
+                self.__jump = previous
 
     def __hash__(self):
         return hash(self.__hash)
@@ -52,47 +77,100 @@ class Score(object):
     def __len__(self):
         return self.__len
 
+    def nout_hash(self):
+        return self.__hash
+
     @classmethod
-    def unique(cls, nout, len_):
-        hash_ = NoteNoutHash.for_object(nout)
+    def unique(cls, nout, len_, previous=None, hash_algorithm=DEFAULT_HASH_ALGORITHM):
+        hash_ = NoteNoutHash.for_object(nout, hash_algorithm)
 
-        if hash_ not in cls.glob:
-            insert_this = cls(nout, hash_, len_, PMM)
-            cls.glob[hash_] = insert_this
+        # NOTE: `get` rather than `in` followed by lookup: in a WeakValueDictionary an entry may disappear in-between.
+        result = cls.glob.get(hash_)
+        if result is None:
+            result = cls(nout, hash_, len_, previous, PMM)
+            cls.glob[hash_] = result
 
-        return cls.glob[hash_]
+        return result
 
     @classmethod
-    def empty(cls):
-        return cls.unique(NoteCapo(), 0)
+    def empty(cls, hash_algorithm=DEFAULT_HASH_ALGORITHM):
+        """The empty Score, as the start of a history that's hashed using hash_algorithm (the Scores that are slurred
+        onto it inherit the algorithm)."""
+        check_hash_algorithm(hash_algorithm)
+        return cls.unique(NoteCapo(), 0, hash_algorithm=hash_algorithm)
+
+    def hash_algorithm(self):
+        return self.__hash.algorithm
 
     def slur(self, note):
-        return self.unique(NoteSlur(note, self.__hash), self.__len + 1)
+        return self.unique(NoteSlur(note, self.__hash), self.__len + 1, self, self.__hash.algorithm)
+
+    def slur_many(self, notes):
+        """Slurs a whole batch of notes (any iterable) onto the score; the equivalent of consecutive calls to slur()."""
+        result = self
+        algorithm = self.__hash.algorithm
+        for note in notes:
+            result = self.unique(NoteSlur(note, result.__hash), result.__len + 1, result, algorithm)
+        return result
 
     @classmethod
-    def from_list(cls, l):
-        result = cls.empty()
-        for n in l:
-            result = result.slur(n)
-        return result
+    def from_list(cls, l, hash_algorithm=DEFAULT_HASH_ALGORITHM):
+        return cls.empty(hash_algorithm).slur_many(l)
 
     def reversed_notes(self):
         return (score.__nout.note for score in self.scores())
 
     def notes(self):
-        return reversed(list(self.reversed_notes()))
+        """The notes, front to back (lazily). Each jump spans a "tree" of scores: itself, the tree at its predecessor
+        and the tree at its predecessor's jump (or only itself, if it jumps to its predecessor). Walking those trees
+        (the earliest one first) gives the notes in order without materializing (and reversing) all of them."""
+        # The roots of the trees: the score itself and the scores that it reaches by jumping.
+        todo = []
+        score = self
+        while score.__previous is not None:
+            todo.append((score, False))
+            score = score.__jump
+
+        while todo:
+            score, expanded = todo.pop()
+            if expanded or score.__jump is score.__previous:
+                yield score.__nout.note
+            else:
+                todo.append((score, True))
+                todo.append((score.__previous, False))
+                todo.append((score.__previous.__jump, False))
 
     def last_note(self):
         return self.__nout.note
 
-    def scores(self):
+    def ancestor(self, length):
+        """Returns the Score consisting of the first `length` notes of this Score."""
+        if not 0 <= length <= self.__len:
+            raise IndexError("No ancestor of length %s for a score of length %s" % (length, self.__len))
+
         score = self
-        while True:
-            nout = score.__nout
-            nout_hash = score.__hash
-            if score.__nout == NoteCapo():
-                return
+        while score.__len > length:
+            if score.__jump.__len >= length:
+                score = score.__jump
+            else:
+                score = score.__previous
+        return score
+
+    def common_ancestor(self, other):
+        """Returns the longest Score that's an ancestor of both self and other (i.e. their longest common prefix)."""
+        a = self.ancestor(min(self.__len, other.__len))
+        b = other.ancestor(min(self.__len, other.__len))
+
+        # Because the layout of the jumps depends only on the length, a and b jump in lockstep.
+        while a is not b:
+            if a.__jump is not b.__jump:
+                a, b = a.__jump, b.__jump
+            else:
+                a, b = a.__previous, b.__previous
+        return a
 
+    def scores(self):
+        score = self
+        while score.__previous is not None:
             yield score
-            nout_hash = nout.previous_hash
-            score = self.glob[nout_hash]
+            score = score.__previous
@@ -24,30 +24,114 @@ from utils import pmts
 
 
 class SimpleScore(object):
+    """Like Score, SimpleScore is a singly linked list, backwards in time; i.e. slur is O(1), and the scores of all
+    versions of a node share their beginnings (and hence: their memory). It has the same skew-binary "jump" links as
+    Score too, for O(log n) ancestors and common ancestors."""
+
+    __slots__ = ('_previous', '_note', '_len', '_jump', '__weakref__')
 
     def __init__(self, data):
         # data :: [Note]   (any kind of note)
         pmts(data, list)
-        self._data = data
+
+        self._previous = None  # `None` for the empty SimpleScore
+        self._note = None
+        self._len = 0
+        self._jump = None
+
+        if data:
+            last = SimpleScore.empty().slur_many(data)
+            self._previous, self._note, self._len, self._jump = last._previous, last._note, last._len, last._jump
+
+    @classmethod
+    def _slurred(cls, previous, note):
+        result = cls.__new__(cls)
+        result._previous = previous
+        result._note = note
+        result._len = previous._len + 1
+
+        # The jump-link, as in Score.
+        jump = previous._jump
+        if jump is not None and jump._jump is not None and previous._len - jump._len == jump._len - jump._jump._len:
+            result._jump = jump._jump
+        else:
+            result._jump = previous
+        return result
 
     def __len__(self):
-        return len(self._data)
+        return self._len
 
     @classmethod
-    def empty(cls):
+    def empty(cls, hash_algorithm=None):
+        # hash_algorithm: for compatibility with Score.empty only; SimpleScores aren't hashed.
         return cls([])
 
+    def hash_algorithm(self):
+        return None
+
     def slur(self, note):
-        return SimpleScore(self._data + [note])
+        return self._slurred(self, note)
+
+    def slur_many(self, notes):
+        result = self
+        for note in notes:
+            result = self._slurred(result, note)
+        return result
 
     def reversed_notes(self):
-        return list(reversed(self.notes()))
+        return [score._note for score in self.scores()]
 
     def notes(self):
-        return self._data
+        # Walks the trees spanned by the jumps, as in Score.notes()
+        result = []
+        todo = []
+        score = self
+        while score._len > 0:
+            todo.append((score, False))
+            score = score._jump
+
+        while todo:
+            score, expanded = todo.pop()
+            if expanded or score._jump is score._previous:
+                result.append(score._note)
+            else:
+                todo.append((score, True))
+                todo.append((score._previous, False))
+                todo.append((score._previous._jump, False))
+        return result
 
     def last_note(self):
-        return self._data[-1]
+        if self._len == 0:
+            raise IndexError("The empty score has no last note")
+        return self._note
+
+    def ancestor(self, length):
+        if not 0 <= length <= self._len:
+            raise IndexError("No ancestor of length %s for a score of length %s" % (length, self._len))
+
+        score = self
+        while score._len > length:
+            if score._jump._len >= length:
+                score = score._jump
+            else:
+                score = score._previous
+        return score
+
+    def common_ancestor(self, other):
+        # Unlike Scores, SimpleScores aren't unique; 2 of them only share the part of their history that they share by
+        # identity (i.e. when one was slurred onto (an ancestor of) the other). As in Score, the jumps go in lockstep.
+        a = self.ancestor(min(self._len, other._len))
+        b = other.ancestor(min(self._len, other._len))
+
+        while a is not b and a._len > 0:
+            if a._jump is not b._jump:
+                a, b = a._jump, b._jump
+            else:
+                a, b = a._previous, b._previous
+        return a
 
     def scores(self):
-        return [SimpleScore(self._data[:i]) for i in (range(len(self._data), 0, -1))]
+        score = self
+        while score._len > 0:
+            yield score
+            score = score._previous
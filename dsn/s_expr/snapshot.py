@@ -0,0 +1,251 @@
+"""
+Snapshots: a serialization of a constructed SExpr tree, including the scores of all its nodes, such that opening a file
+does not require replaying its full history through `play_score`.
+
+A snapshot is keyed by the root score of the tree (its length and hash). When loading, the snapshot is only used if
+the given score has the snapshot's root score as an ancestor (i.e. if the hash chain matches); otherwise it is ignored
+and the caller falls back to a full replay.
+
+The root score itself is not part of the snapshot (the history file is the source of truth for it), but the scores of
+all other nodes are. They are stored as a table of (previous, note) records, in which `previous` refers to an earlier
+record (or to the empty score). Because the scores of all versions of a node share their beginnings, each Score is
+stored only once.
+
+The notes of a child's score are (mostly) the child_notes of the Inserts and Extends in its parent's score; such notes
+are stored as a reference to the parent's note rather than in full. Otherwise, in a deep tree, the same (long) chain of
+Extends would be stored again at each level of the tree.
+
+Format (all integers are VLQs):
+
+    MAGIC
+    root score: length, hash (32 bytes)
+    score table: number of records, then for each record: previous (0 for the empty score, i + 1 for record i), then
+        either 0 followed by the note, or the note as a reference to the note of which it is the child_note: k + 1 for
+        the k-th note of the root score counting back from its end, len(root score) + i + 1 for the note of record i
+    tree, in pre-order; for each node:
+        ATOM: score (as previous above), length of the utf-8 encoded atom, the utf-8 encoded atom
+        LIST: score (idem), number of children, len(t2s), t2s (0 for None, s + 1 otherwise), the children
+"""
+
+import os
+
+from pvector import PVector
+from spacetime import st_from_lists
+from utils import pmts, rfb
+from vlq import write_vlq, from_vlq_buffer
+
+from dsn.s_expr.clef import Note, Insert, Extend
+from dsn.s_expr.construct import unique
+from dsn.s_expr.legato import NoteNoutHash
+from dsn.s_expr.score import Score
+from dsn.s_expr.structure import SExpr, Atom, List
+
+MAGIC = b"NERF1SNAPSHOT\x01"
+
+ATOM = 0
+LIST = 1
+
+ROOT_SCORE = 0  # in the tree: the score of the root node refers to the root score, which is not in the score table
+
+
+def snapshot_as_bytes(tree):
+    pmts(tree, SExpr)
+    root_score = tree.score
+
+    table = {}  # Score => record number (1-based)
+    records = []  # [(previous, note reference or None, note)]
+
+    # id(note) => reference to the note of which it's the child_note. (ids are safe to use here: all notes involved are
+    # kept alive by the tree)
+    parents = {}
+    for k, note in enumerate(root_score.reversed_notes()):
+        if isinstance(note, (Insert, Extend)):
+            parents[id(note.child_note)] = k + 1
+
+    def add_score(score):
+        if score == root_score:
+            return ROOT_SCORE
+
+        chain = []
+        previous = 0  # the empty score
+        for s in score.scores():
+            if s in table:
+                previous = table[s]
+                break
+            chain.append(s)
+
+        for s in reversed(chain):
+            note = s.last_note()
+            records.append((previous, parents.get(id(note)), note))
+            previous = table[s] = len(records)
+            if isinstance(note, (Insert, Extend)):
+                parents.setdefault(id(note.child_note), len(root_score) + previous)
+
+        return previous
+
+    # The tree is written in pre-order, using an explicit stack rather than recursion: deep trees are cheap to
+    # construct (see construct.play_note), so they should not be a problem here either.
+    tree_bytes = bytearray()
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        tree_bytes.append(ATOM if isinstance(node, Atom) else LIST)
+        write_vlq(tree_bytes, add_score(node.score))
+
+        if isinstance(node, Atom):
+            utf8 = node.atom.encode('utf-8')
+            write_vlq(tree_bytes, len(utf8))
+            tree_bytes.extend(utf8)
+            continue
+
+        write_vlq(tree_bytes, len(node.children))
+        write_vlq(tree_bytes, len(node.t2s))
+        for s in node.t2s:
+            write_vlq(tree_bytes, 0 if s is None else s + 1)
+
+        stack.extend(reversed(node.children))
+
+    result = bytearray(MAGIC)
+    write_vlq(result, len(root_score))
+    result.extend(root_score.nout_hash().as_bytes())
+
+    write_vlq(result, len(records))
+    for previous, reference, note in records:
+        write_vlq(result, previous)
+        if reference is None:
+            write_vlq(result, 0)
+            result.extend(note.as_bytes())
+        else:
+            write_vlq(result, reference)
+
+    result.extend(tree_bytes)
+    return bytes(result)
+
+
+def tree_from_snapshot_bytes(buffer, score):
+    """Returns (root_score, tree) for the snapshot in buffer, where root_score is the ancestor of `score` at which the
+    snapshot was made; returns None if the snapshot doesn't apply to `score`."""
+
+    pmts(score, Score)
+    buffer = memoryview(buffer)
+
+    magic, offset = rfb(buffer, 0, len(MAGIC))
+    if magic != MAGIC:
+        return None
+
+    root_length, offset = from_vlq_buffer(buffer, offset)
+    root_hash, offset = NoteNoutHash.from_buffer(buffer, offset)
+
+    if root_length > len(score):
+        return None
+
+    root_score = score.ancestor(root_length)
+    if root_score.nout_hash() != root_hash:
+        return None  # the hash chain does not match
+
+    record_count, offset = from_vlq_buffer(buffer, offset)
+    scores = [Score.empty(root_score.hash_algorithm())]  # the nodes' scores are hashed like the root's (see construct)
+    root_notes = None  # the root score's notes, from the end; only looked up if referred to
+    for i in range(record_count):
+        previous, offset = from_vlq_buffer(buffer, offset)
+        reference, offset = from_vlq_buffer(buffer, offset)
+
+        if reference == 0:
+            note, offset = Note.from_buffer(buffer, offset, keep_bytes=True)  # the bytes are needed for hashing
+        else:
+            if reference <= root_length:
+                if root_notes is None:
+                    root_notes = list(root_score.reversed_notes())
+                parent = root_notes[reference - 1]
+            else:
+                parent = scores[reference - root_length].last_note()
+
+            if not isinstance(parent, (Insert, Extend)):
+                raise ValueError("Reference to a note without a child note: %s" % reference)
+            note = parent.child_note
+
+        scores.append(scores[previous].slur(note))
+
+    def read_score(offset):
+        index, offset = from_vlq_buffer(buffer, offset)
+        return (root_score if index == ROOT_SCORE else scores[index]), offset
+
+    # The mirror image of the writing in snapshot_as_bytes: iteratively, with an explicit stack of the Lists of which
+    # not all children have been read yet. The nodes are constructed like play_note does: with PVector children, and
+    # hash-consed (i.e. a node that's already in memory is shared rather than duplicated).
+    stack = []  # [(score, t2s, s2t, child_count, children)]
+    tree = None
+    while tree is None:
+        node_type = buffer[offset]
+        node_score, offset = read_score(offset + 1)
+
+        if node_type == ATOM:
+            length, offset = from_vlq_buffer(buffer, offset)
+            utf8, offset = rfb(buffer, offset, length)
+            node = unique(Atom(str(utf8, 'utf-8'), node_score))
+
+        elif node_type == LIST:
+            child_count, offset = from_vlq_buffer(buffer, offset)
+            t2s_length, offset = from_vlq_buffer(buffer, offset)
+
+            t2s = []
+            s2t = [None] * child_count
+            for t in range(t2s_length):
+                value, offset = from_vlq_buffer(buffer, offset)
+                if value == 0:
+                    t2s.append(None)
+                else:
+                    t2s.append(value - 1)
+                    s2t[value - 1] = t
+
+            stack.append((node_score, t2s, s2t, child_count, []))
+            node = None
+
+        else:
+            raise ValueError("Unknown node type: %s" % node_type)
+
+        # Each completed node is a child of the List below it on the stack, which may thereby be completed too.
+        while True:
+            if node is not None:
+                if not stack:
+                    tree = node
+                    break
+                stack[-1][4].append(node)
+
+            node_score, t2s, s2t, child_count, children = stack[-1]
+            if len(children) < child_count:
+                break
+
+            stack.pop()
+            t2s, s2t = st_from_lists(t2s, s2t)
+            node = unique(List(PVector(children), t2s, s2t, node_score))
+
+    if offset != len(buffer):
+        return None
+
+    return root_score, tree
+
+
+def write_snapshot(filename, tree):
+    # Written to a temporary file first, and then moved into place: a snapshot file is never half-written.
+    temporary_filename = filename + ".tmp"
+    with open(temporary_filename, 'wb') as f:
+        f.write(snapshot_as_bytes(tree))
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(temporary_filename, filename)
+
+
+def read_snapshot(filename, score):
+    """Returns (root_score, tree) for the snapshot in the file, if it exists and applies to `score`; None otherwise."""
+    if not os.path.isfile(filename):
+        return None
+
+    with open(filename, 'rb') as f:
+        data = f.read()
+
+    try:
+        return tree_from_snapshot_bytes(data, score)
+    except (IndexError, KeyError, ValueError):
+        return None  # a corrupt snapshot is no snapshot
@@ -1,21 +1,28 @@
-from utils import pmts, pmts_or_none
+from utils import pmts, pmts_or_none, TYPE_CHECKS
 from dsn.s_expr.note_address import SExprELS18NoteAddress
 
 
 class SExpr(object):
+    # Every memoized version of every node is kept around; i.e. there are many of them, and the per-instance __dict__
+    # would be the bulk of their size. __weakref__ is needed for the hash-consing (see construct.py).
+    __slots__ = ('__weakref__',)
+
     def __init__(self, *args, **kwargs):
         raise TypeError("SExpr is Abstract; use List or Atom instead")
 
 
 class Atom(SExpr):
+    __slots__ = ('atom', 'score', 'address')
 
     def __init__(self, atom, score=None, address=None):
-        pmts(atom, str)
+        if TYPE_CHECKS:
+            pmts(atom, str)
+            pmts_or_none(address, SExprELS18NoteAddress)
+
         self.atom = atom
         self.score = score
 
         # NOTE: `address` is used exclusively when the SExpr is the result of clef_address.py's "GlobNote" to_s_expr()
-        pmts_or_none(address, SExprELS18NoteAddress)
         self.address = address
 
     def __repr__(self):
@@ -27,10 +34,17 @@ class Atom(SExpr):
 
 
 class List(SExpr):
+    __slots__ = ('children', 't2s', 's2t', 'score', 'address')
 
     def __init__(self, children, t2s=None, s2t=None, score=None, address=None):
-        for i, child in enumerate(children):
-            pmts(child, SExpr, "child: %s" % i)
+        if TYPE_CHECKS:
+            # PVectors (see list_operations) are the result of playing notes, which only ever adds SExprs to them;
+            # checking them here would make each note O(n) again.
+            if isinstance(children, list):
+                for i, child in enumerate(children):
+                    pmts(child, SExpr, "child: %s" % i)
+
+            pmts_or_none(address, SExprELS18NoteAddress)
 
         self.children = children
         self.t2s = t2s
@@ -38,7 +52,6 @@ class List(SExpr):
         self.score = score
 
         # NOTE: `address` is used exclusively when the SExpr is the result of clef_address.py's "GlobNote" to_s_expr()
-        pmts_or_none(address, SExprELS18NoteAddress)
         self.address = address
 
     def __repr__(self):
@@ -126,3 +126,40 @@ def follow_cursor(viewport_size, cursor_size, vrtc):
     if vrtc < bottom:
         return bottom
     return vrtc
+
+
+def estimated_size(measured_size, measured_count, count):
+    """
+    Estimates the size of `count` items, given that `measured_count` (other) items were measured to take `measured_size`
+    together. Useful for documents of which only a part is actually laid out.
+
+    >>> estimated_size(300, 10, 1000)
+    30000
+
+    Without measurements we cannot make a reasonable estimate, so we don't:
+    >>> estimated_size(0, 0, 1000)
+    0
+    """
+    if measured_count == 0:
+        return 0
+
+    return int(measured_size * count / measured_count)
+
+
+def window_around_cursor(cursor, count, viewport_size, item_size_estimate, margin):
+    """
+    Returns the range (start, end) of the items (out of `count`, of an estimated size each) that need to be laid out
+    such that any viewport that contains the cursor item is fully covered, with `margin` extra items on either side.
+
+    >>> window_around_cursor(5000, 10000, 600, 50, 10)
+    (4978, 5023)
+
+    The window is bounded by the document:
+    >>> window_around_cursor(3, 10000, 600, 50, 10)
+    (0, 26)
+    >>> window_around_cursor(9999, 10000, 600, 50, 10)
+    (9977, 10000)
+    """
+    n = int(viewport_size // item_size_estimate) + margin
+
+    return max(0, cursor - n), min(count, cursor + n + 1)
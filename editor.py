@@ -11,8 +11,12 @@ from channel import ClosableChannel
 
 from filehandler import (
     FileWriter,
+    GROUP_COMMIT,
+    SnapshotWriter,
     initialize_history,
-    read_from_file
+    load_snapshot,
+    read_hash_algorithm,
+    read_notes_from_file,
 )
 
 from widgets.tree import TreeWidget
@@ -27,8 +31,8 @@ Config.set('kivy', 'exit_on_escape', '0')
 
 
 class NoteCollector(object):
-    def __init__(self, channel):
-        self.score = Score.empty()
+    def __init__(self, channel, hash_algorithm):
+        self.score = Score.empty(hash_algorithm)
 
         # receive-only connection: NoteCollector's outwards communication goes via others reading
         # self.note
@@ -38,16 +42,25 @@ class NoteCollector(object):
         pmts(data, Note)
         self.score = self.score.slur(data)
 
+    def receive_many(self, notes):
+        # Bulk-version of receive, for when we have a lot of notes at once (i.e. when reading from a file); bypasses the
+        # channel altogether.
+        self.score = self.score.slur_many(notes)
+
 
 class EditorGUI(App):
 
-    def __init__(self, filename):
+    def __init__(self, filename, hash_algorithm=None):
         super(EditorGUI, self).__init__()
 
         self.m = Memoization()
 
         self.filename = filename
 
+        # By default we stick with whatever the file was created with. If a different algorithm is given, the file's
+        # index is rebuilt (and its snapshot is replaced) using that algorithm.
+        self.hash_algorithm = hash_algorithm or read_hash_algorithm(filename)
+
         self.setup_channels()
 
         self.do_initial_file_read()
@@ -56,18 +69,36 @@ class EditorGUI(App):
         # This is the main channel of Notes for our application.
         self.history_channel = ClosableChannel()  # No relation with the T.V. channel of the same name
 
-        self.lnh = NoteCollector(self.history_channel)
+        self.lnh = NoteCollector(self.history_channel, self.hash_algorithm)
 
     def do_initial_file_read(self):
         if isfile(self.filename):
             # ReadFromFile before connecting to the Writer to ensure that reading from the file does not write to it
-            read_from_file(self.filename, self.history_channel)
-            FileWriter(self.history_channel, self.filename)
+            self.lnh.receive_many(read_notes_from_file(self.filename))
+
+            # If there's a matching snapshot, the initial play_score only needs to play the notes after it.
+            load_snapshot(self.m, self.filename, self.lnh.score)
+
+            self.file_writer = self.create_file_writer()
+            self.snapshot_writer = SnapshotWriter(self.history_channel, self.m, self.filename, self.lnh.score)
         else:
             # FileWriter first to ensure that the initialization becomes part of the file.
-            FileWriter(self.history_channel, self.filename)
+            self.file_writer = self.create_file_writer()
+            self.snapshot_writer = SnapshotWriter(self.history_channel, self.m, self.filename, self.lnh.score)
             initialize_history(self.history_channel)
 
+    def create_file_writer(self):
+        # GROUP_COMMIT: bursts of notes (e.g. from quick editing) are written to disk in the background, in groups.
+        return FileWriter(self.history_channel, self.filename, index=True, hash_algorithm=self.hash_algorithm,
+                          durability=GROUP_COMMIT)
+
+    def on_stop(self):
+        # Ensures that all notes that are still queued for writing end up on disk.
+        self.file_writer.close()
+
+        # Such that the next time the file is opened, it need not be replayed.
+        self.snapshot_writer.close()
+
     def add_tree_and_stuff(self, history_channel):
 
         def switch_panes(mode):
@@ -131,11 +162,11 @@ class EditorGUI(App):
 
 
 def main():
-    if len(argv) != 2:
-        print("Usage: ", argv[0], "FILENAME")
+    if len(argv) not in (2, 3):
+        print("Usage: ", argv[0], "FILENAME [HASH_ALGORITHM]")
         exit()
 
-    EditorGUI(argv[1]).run()
+    EditorGUI(argv[1], argv[2] if len(argv) == 3 else None).run()
 
 
 if __name__ == "__main__":
@@ -1,34 +1,633 @@
+"""
+Reading and writing of history files. A history file is a bare concatenation of the serialized notes
+(`Note.as_bytes()`), which means it can only be read front to back.
+
+To enable random access (by note number) a history file may be accompanied by an index, which consists of 2 sidecar
+files:
+
+* `<filename>.offsets`: for each note, the offset in the history file at which it starts (fixed-width records).
+* `<filename>.hashes`: for every HASH_EVERY notes: the number of notes and the hash of the Score up to that point.
+
+The name of the hashing algorithm (see type_factories.HASH_ALGORITHMS) is stored in `<filename>.hash-algorithm`; if
+that file is missing, the default algorithm is implied. It's the algorithm of the file's history: read it using
+`Score.empty(read_hash_algorithm(filename))`. Readers and writers of the index use it unless they're given another one.
+
+The index is derived information: if it's missing or doesn't match the history file (or was made with another hashing
+algorithm), the writer rebuilds it from the history; readers compute it in memory.
+
+Likewise, `<filename>.snapshot` (see dsn/s_expr/snapshot.py) contains the tree as constructed from (some prefix of) the
+history; it's used to avoid replaying the full history when opening a file, and ignored if it doesn't match.
+"""
+
+import mmap
+import os
+import struct
+import warnings
+
+from contextlib import contextmanager, ExitStack
+from queue import Queue, Empty
+from threading import Condition, Event, Thread
+from time import monotonic
+
+from type_factories import DEFAULT_HASH_ALGORITHM, check_hash_algorithm
 from utils import pmts
 from dsn.s_expr.clef import Note, BecomeList
+from dsn.s_expr.construct import play_score
+from dsn.s_expr.legato import NoteCapo, NoteSlur, NoteNoutHash
+from dsn.s_expr.snapshot import read_snapshot, write_snapshot
+
+HASH_EVERY = 1024
+
+OFFSET_RECORD = struct.Struct(">Q")  # offset
+HASH_RECORD = struct.Struct(">Q32s")  # number of notes, hash of the score consisting of those notes
+
+# A snapshot is written (by SnapshotWriter) every this many notes.
+SNAPSHOT_EVERY = 1000
 
 
 def all_notes_from_stream(byte_stream):
     while True:
-        yield Note.from_stream(byte_stream)  # Transparently yields the StopIteration at the lower level
+        try:
+            yield Note.from_stream(byte_stream)
+        except StopIteration:
+            # The end of the stream. (Since PEP 479 a StopIteration is no longer transparently propagated out of a
+            # generator, hence the explicit return)
+            return
+
+
+def all_notes_from_buffer(buffer, offset=0):
+    """Yields (note, offset) pairs, where offset is the offset at which the note starts. The notes keep the bytes they
+    were read from, because the typical next step is to hash them (i.e. slur them onto a Score).
+
+    A note that runs past the end of the buffer is the result of a crash while it was being written (notes are only
+    ever appended); it's ignored, with a warning. (The next FileWriter for the file truncates it)"""
+    while offset < len(buffer):
+        try:
+            note, next_offset = Note.from_buffer(buffer, offset, keep_bytes=True)
+        except IndexError:
+            warnings.warn("Ignoring a partially written note at the end of a history (%s bytes)" % (
+                len(buffer) - offset))
+            return
+
+        yield note, offset
+        offset = next_offset
+
+
+def _complete_notes_size(buffer):
+    """The size of the part of the buffer that consists of complete notes, i.e. without a partially written one."""
+    size = 0
+    for note, offset in all_notes_from_buffer(buffer):
+        size = offset + len(note.as_bytes())
+    return size
+
+
+@contextmanager
+def _read_mapped(filename):
+    """Yields the contents of the file as a memoryview on a (read only) mmap, or on b'' for empty files (which cannot be
+    mmap'ed). The mmap is closed on exit, so nothing that's derived from the memoryview may be kept beyond that."""
+    with open(filename, 'rb') as file_:
+        if os.fstat(file_.fileno()).st_size == 0:
+            yield memoryview(b'')
+            return
+
+        with mmap.mmap(file_.fileno(), 0, access=mmap.ACCESS_READ) as mapped, memoryview(mapped) as buffer:
+            yield buffer
+
+
+def read_notes_from_file(filename):
+    with _read_mapped(filename) as buffer:
+        for note, offset in all_notes_from_buffer(buffer):
+            yield note
+
+
+def offsets_filename(filename):
+    return filename + ".offsets"
+
+
+def hashes_filename(filename):
+    return filename + ".hashes"
+
+
+def snapshot_filename(filename):
+    return filename + ".snapshot"
+
+
+def hash_algorithm_filename(filename):
+    return filename + ".hash-algorithm"
+
+
+def read_hash_algorithm(filename):
+    """Returns the name of the hashing algorithm that's used for the history file."""
+    if not os.path.isfile(hash_algorithm_filename(filename)):
+        return DEFAULT_HASH_ALGORITHM
+
+    with open(hash_algorithm_filename(filename), 'r') as f:
+        return f.read().strip()
+
+
+def write_hash_algorithm(filename, name):
+    with open(hash_algorithm_filename(filename), 'w') as f:
+        f.write(name + "\n")
+
+
+def _slur_hash(note, previous_hash):
+    # Equal to the hash of the Score that results from slurring `note` onto a Score with hash `previous_hash`
+    return NoteNoutHash.for_object(NoteSlur(note, previous_hash), previous_hash.algorithm)
+
+
+def _capo_hash(hash_algorithm):
+    # Equal to the hash of Score.empty(hash_algorithm)
+    return NoteNoutHash.for_object(NoteCapo(), hash_algorithm)
+
+
+def _index_from_buffer(buffer, hash_every, hash_algorithm):
+    """Computes the index for the notes in the buffer; returns (offsets, hashes, state), where offsets and hashes are
+    the contents of the respective files, and state is the index' state: (count, size, last_hash)"""
+    offsets, hashes = bytearray(), bytearray()
+
+    count, size, last_hash = 0, 0, _capo_hash(hash_algorithm)
+    for note, offset in all_notes_from_buffer(buffer):
+        offsets.extend(OFFSET_RECORD.pack(offset))
+        size = offset + len(note.as_bytes())
+
+        count += 1
+        last_hash = _slur_hash(note, last_hash)
+        if count % hash_every == 0:
+            hashes.extend(HASH_RECORD.pack(count, last_hash.as_bytes()))
+
+    return offsets, hashes, (count, size, last_hash)
+
+
+def rebuild_index(filename, hash_every=HASH_EVERY, hash_algorithm=None):
+    """(Re)creates the index for the history file from scratch; returns the index' state: (count, size, last_hash)
+
+    Only to be called by the (single) writer of the file: the index files are overwritten."""
+    hash_algorithm = hash_algorithm or read_hash_algorithm(filename)
+    with _read_mapped(filename) as buffer:
+        offsets, hashes, state = _index_from_buffer(buffer, hash_every, hash_algorithm)
+
+    write_hash_algorithm(filename, hash_algorithm)
+    with open(offsets_filename(filename), 'wb') as offsets_file, open(hashes_filename(filename), 'wb') as hashes_file:
+        offsets_file.write(offsets)
+        hashes_file.write(hashes)
+
+    return state
+
+
+def _index_files_exist(filename, hash_algorithm):
+    if not (os.path.isfile(offsets_filename(filename)) and os.path.isfile(hashes_filename(filename))):
+        return False
+
+    # If the hashes in the index were computed using a different algorithm, it's as good as non-existent.
+    return read_hash_algorithm(filename) == hash_algorithm
+
+
+def _existing_index_state(filename, hash_algorithm):
+    """Returns the index' state: (count, size, last_hash) if the existing index matches the history file; None
+    otherwise."""
+    if not _index_files_exist(filename, hash_algorithm):
+        return None
+
+    with _read_mapped(filename) as buffer, _read_mapped(offsets_filename(filename)) as offsets, \
+            _read_mapped(hashes_filename(filename)) as hashes:
+        return _index_state(buffer, offsets, hashes, hash_algorithm)
+
+
+def _index_state(buffer, offsets, hashes, hash_algorithm):
+    """Like _existing_index_state, but for the contents of the (mapped) files."""
+    if len(offsets) % OFFSET_RECORD.size != 0 or len(hashes) % HASH_RECORD.size != 0:
+        return None  # partially written records
+
+    count = len(offsets) // OFFSET_RECORD.size
+
+    try:
+        # The index matches the file if the last indexed note ends precisely at the end of the file.
+        if count == 0:
+            end = 0
+        else:
+            last_offset, = OFFSET_RECORD.unpack_from(offsets, (count - 1) * OFFSET_RECORD.size)
+            _, end = Note.from_buffer(buffer, last_offset)
+    except (IndexError, KeyError, ValueError):
+        return None  # the offset does not point to a note
+
+    if end != len(buffer):
+        return None
+
+    # We don't store the hash of the last note explicitly; we get it by rehashing the notes after the last checkpoint.
+    checkpoint_count, last_hash = _last_checkpoint(hashes, count, hash_algorithm)
+    if checkpoint_count > count:
+        return None
+
+    try:
+        for i in range(checkpoint_count, count):
+            offset, = OFFSET_RECORD.unpack_from(offsets, i * OFFSET_RECORD.size)
+            note, _ = Note.from_buffer(buffer, offset)
+            last_hash = _slur_hash(note, last_hash)
+    except (IndexError, KeyError, ValueError):
+        return None  # idem
+
+    return count, len(buffer), last_hash
+
+
+def _last_checkpoint(hashes, max_count, hash_algorithm):
+    """Finds the last (count, hash) in the hashes-buffer for which count <= max_count; the records are sorted by count,
+    so we can do a binary search."""
+    result = 0, _capo_hash(hash_algorithm)
+
+    lo, hi = 0, len(hashes) // HASH_RECORD.size
+    while lo < hi:
+        mid = (lo + hi) // 2
+        count, hash_bytes = HASH_RECORD.unpack_from(hashes, mid * HASH_RECORD.size)
+        if count <= max_count:
+            result = count, NoteNoutHash(hash_bytes, hash_algorithm)
+            lo = mid + 1
+        else:
+            hi = mid
+
+    return result
+
+
+class IndexWriter(object):
+    """Keeps the index of a history file up to date while notes are appended to it. If hash_algorithm is given (and
+    differs from the file's), the index is rebuilt using that algorithm; i.e. it becomes the file's algorithm."""
+
+    def __init__(self, filename, hash_every=HASH_EVERY, hash_algorithm=None):
+        self.hash_every = hash_every
+        self.hash_algorithm = hash_algorithm or read_hash_algorithm(filename)
+        check_hash_algorithm(self.hash_algorithm)
+
+        state = _existing_index_state(filename, self.hash_algorithm)
+        if state is None:
+            state = rebuild_index(filename, hash_every, self.hash_algorithm)
+
+        self.count, self.size, self.last_hash = state
+
+        self.offsets_file = open(offsets_filename(filename), 'ab')
+        self.hashes_file = open(hashes_filename(filename), 'ab')
+
+    def add(self, note, note_bytes):
+        """To be called for each note that's appended to the history file, with the note's serialization."""
+        self.offsets_file.write(OFFSET_RECORD.pack(self.size))
+        self.size += len(note_bytes)
+
+        self.count += 1
+        self.last_hash = _slur_hash(note, self.last_hash)
+        if self.count % self.hash_every == 0:
+            self.hashes_file.write(HASH_RECORD.pack(self.count, self.last_hash.as_bytes()))
+
+    def flush(self):
+        self.offsets_file.flush()
+        self.hashes_file.flush()
+
+    def close(self):
+        self.offsets_file.close()
+        self.hashes_file.close()
+
+
+class IndexedHistory(object):
+    """Random access (by note number) to the notes in a history file, using its index.
+
+    The history is read as it is at the moment of construction; notes that are appended later are not seen. The files
+    stay mapped until close() is called; use as a context manager to have that done automatically.
+
+    If the index doesn't match the history file, it's computed in memory instead. The index files are left alone:
+    they're the FileWriter's (which may have them open for appending at this very moment), and it repairs them. The
+    same goes for an index that's made with another algorithm than hash_algorithm (by default: the file's)."""
+
+    def __init__(self, filename, hash_algorithm=None):
+        self.hash_algorithm = hash_algorithm or read_hash_algorithm(filename)
+        check_hash_algorithm(self.hash_algorithm)
+
+        with ExitStack() as stack:
+            self.buffer = stack.enter_context(_read_mapped(filename))
+            self.offsets, self.hashes = None, None
+
+            if _index_files_exist(filename, self.hash_algorithm):
+                # The index is checked against what's actually mapped: a writer may be appending in the meantime.
+                index_stack = ExitStack()
+                stack.enter_context(index_stack)
+                offsets = index_stack.enter_context(_read_mapped(offsets_filename(filename)))
+                hashes = index_stack.enter_context(_read_mapped(hashes_filename(filename)))
+
+                if _index_state(self.buffer, offsets, hashes, self.hash_algorithm) is None:
+                    index_stack.close()
+                else:
+                    self.offsets, self.hashes = offsets, hashes
+
+            if self.offsets is None:
+                self.offsets, self.hashes, (count, _, last_hash) = _index_from_buffer(
+                    self.buffer, HASH_EVERY, self.hash_algorithm)
+
+                # We have the hash of the full history in hand anyway; as a checkpoint it saves rehashing later.
+                if count % HASH_EVERY != 0:
+                    self.hashes.extend(HASH_RECORD.pack(count, last_hash.as_bytes()))
+
+            # Only once all files are mapped do we take over the responsibility for unmapping them.
+            self._mappings = stack.pop_all()
+
+    def close(self):
+        """Unmaps the files. Idempotent."""
+        self._mappings.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.offsets) // OFFSET_RECORD.size
+
+    def offset(self, n):
+        if not (0 <= n < len(self)):
+            raise IndexError("Note number out of bounds: %s" % n)
+
+        return OFFSET_RECORD.unpack_from(self.offsets, n * OFFSET_RECORD.size)[0]
+
+    def note(self, n):
+        note, _ = Note.from_buffer(self.buffer, self.offset(n))
+        return note
+
+    def notes(self, start=0, stop=None):
+        """Yields the notes numbered [start, stop)"""
+        stop = len(self) if stop is None else min(stop, len(self))
+        if start >= stop:
+            return
+
+        offset = self.offset(start)
+        for i in range(start, stop):
+            note, offset = Note.from_buffer(self.buffer, offset)
+            yield note
+
+    def last_checkpoint(self, max_count=None):
+        """Returns (count, hash) for the last indexed Score that consists of at most max_count notes; i.e. a point from
+        which reading may be resumed by reading notes(count, ...)"""
+        return _last_checkpoint(self.hashes, len(self) if max_count is None else max_count, self.hash_algorithm)
+
+
+# Durability modes for FileWriter:
+PER_NOTE = 0  # each note is written and flushed as soon as it's received (synchronously).
+GROUP_COMMIT = 1  # notes are written by a background thread; committed every `group_size` notes or `group_interval`.
+CHECKPOINT = 2  # notes are written by a background thread; committed only on explicit checkpoint() (and on close()).
+
+# Markers that are put on the queue of the background thread (besides notes)
+_CHECKPOINT = object()
+_CLOSE = object()
 
 
 class FileWriter(object):
-    """For lack of a better name: Handles the writing of Notes objects to files."""
+    """For lack of a better name: Handles the writing of Notes objects to files.
+
+    In the modes GROUP_COMMIT and CHECKPOINT the writing is done by a background thread, which is fed by a bounded
+    queue (when the queue is full, receiving blocks until the thread catches up). Committing means: flushing the file
+    and the index, and fsync-ing the file. close() drains the queue and commits the remaining notes.
+    """
 
-    def __init__(self, channel, filename):
-        # LATER: proper file-closing too! In the status quo there's 2 (related) open ends:
-        # 1] we don't do any file closing ourselves at any point
-        # 2] we don't have an implementation for closing channels yet
+    def __init__(self, channel, filename, index=False, hash_every=HASH_EVERY, hash_algorithm=None, durability=PER_NOTE,
+                 group_size=64, group_interval=0.1, queue_size=1024):
+        # LATER: proper channel-closing too; we don't have an implementation for closing channels yet. Closing the
+        # file is done by calling close() explicitly.
         self.file_ = open(filename, 'ab')
 
+        # The index is created before any note is written, i.e. it's always consistent with the file as it is.
+        self.index = IndexWriter(filename, hash_every, hash_algorithm) if index else None
+
+        # A crash while writing (e.g. in the middle of a group commit) may have left a partially written note at the end
+        # of the file; it's truncated, such that new notes are appended right after the last complete one.
+        if self.index is not None:
+            size = self.index.size
+        else:
+            with _read_mapped(filename) as buffer:
+                size = _complete_notes_size(buffer)
+
+        if os.fstat(self.file_.fileno()).st_size > size:
+            warnings.warn("Truncating a partially written note at the end of %s" % filename)
+            self.file_.truncate(size)
+
+        self.durability = durability
+        self.group_size = group_size
+        self.group_interval = group_interval  # in seconds
+
+        self.closed = False
+        self.error = None  # an exception in the background thread, re-raised in the foreground on the next interaction
+
+        if durability != PER_NOTE:
+            self.queue = Queue(maxsize=queue_size)
+            self.thread = Thread(target=self._write_in_background, name="FileWriter(%s)" % filename, daemon=True)
+            self.thread.start()
+
         # receive-only connection: FileWriters are ChannelReaders
         channel.connect(self.receive)
 
     def receive(self, data):
         # Receives: Note writes it to the connected file
         pmts(data, Note)
-        self.file_.write(data.as_bytes())
+        self._check_usable()
+
+        if self.durability == PER_NOTE:
+            self._write(data, data.as_bytes())
+            self._flush()
+        else:
+            # Serialization is done in the foreground: it's the only part that touches the (shared) note objects.
+            self.queue.put((data, data.as_bytes()))
+
+    def checkpoint(self):
+        """Blocks until all notes received so far are committed."""
+        self._check_usable()
+
+        if self.durability == PER_NOTE:
+            self._commit()
+            return
+
+        done = Event()
+        self.queue.put((_CHECKPOINT, done))
+        done.wait()
+        self._check_usable()
+
+    def close(self):
+        """Drains the queue (if any), commits, and closes the files. Idempotent."""
+        if self.closed:
+            return
+
+        if self.durability == PER_NOTE:
+            self._commit()
+        else:
+            self.queue.put((_CLOSE, None))
+            self.thread.join()
+
+        self.closed = True
+        self.file_.close()
+        if self.index is not None:
+            self.index.close()
+
+        if self.error is not None:
+            raise self.error
+
+    def _check_usable(self):
+        if self.error is not None:
+            raise self.error
+        if self.closed:
+            raise Exception("FileWriter closed")
+
+    def _write(self, note, note_bytes):
+        self.file_.write(note_bytes)
+
+        if self.index is not None:
+            # The index is updated after the note is written, such that a crash in between leaves the index behind
+            # (which is detected and repaired), rather than ahead. (The file is flushed before the index for the same
+            # reason)
+            self.index.add(note, note_bytes)
+
+    def _flush(self):
         self.file_.flush()
+        if self.index is not None:
+            self.index.flush()
+
+    def _commit(self):
+        self.file_.flush()
+        os.fsync(self.file_.fileno())
+        if self.index is not None:
+            self.index.flush()
+
+    def _write_in_background(self):
+        uncommitted = 0
+        deadline = None  # when the uncommitted notes must be committed at the latest (GROUP_COMMIT only)
+
+        try:
+            while True:
+                try:
+                    timeout = None if deadline is None else max(0, deadline - monotonic())
+                    item, payload = self.queue.get(timeout=timeout)
+                except Empty:
+                    item = None  # i.e. the deadline has passed
+
+                if isinstance(item, Note):
+                    self._write(item, payload)
+                    uncommitted += 1
+                    if deadline is None and self.durability == GROUP_COMMIT:
+                        deadline = monotonic() + self.group_interval
+
+                commit = (
+                    item in (_CHECKPOINT, _CLOSE) or
+                    (self.durability == GROUP_COMMIT and uncommitted > 0 and (
+                        item is None or uncommitted >= self.group_size or monotonic() >= deadline)))
+
+                if commit:
+                    self._commit()
+                    uncommitted, deadline = 0, None
+
+                if item is _CHECKPOINT:
+                    payload.set()
+
+                if item is _CLOSE:
+                    return
+
+        except Exception as e:
+            self.error = e
+
+            # Unblock any waiters; from here on the queue is drained without writing anything.
+            while True:
+                item, payload = self.queue.get()
+                if item is _CHECKPOINT:
+                    payload.set()
+                if item is _CLOSE:
+                    return
+
+
+class SnapshotWriter(object):
+    """Keeps track of the score as it's broadcast on the channel, and writes a snapshot of the constructed tree every
+    `every` notes (and on close()).
+
+    The writing (serializing the full tree, writing it and fsync-ing it) is done by a background thread, such that it
+    doesn't stall the broadcast of notes. The tree itself is constructed in the foreground, because play_score touches
+    the (shared) memoization; when editing, the tree is in there already. If snapshots are scheduled faster than they
+    can be written, only the most recent one is written."""
+
+    def __init__(self, channel, m, filename, score, every=SNAPSHOT_EVERY):
+        self.m = m
+        self.filename = snapshot_filename(filename)
+        self.score = score
+        self.every = every
+        self.since_last_write = 0
+
+        self.condition = Condition()
+        self.pending = None  # the tree that's to be written next (by the background thread)
+        self.closed = False
+        self.error = None  # an exception in the background thread, re-raised on close()
+
+        self.thread = Thread(target=self._write_in_background, name="SnapshotWriter(%s)" % filename, daemon=True)
+        self.thread.start()
+
+        channel.connect(self.receive)
+
+    def receive(self, data):
+        pmts(data, Note)
+        self.score = self.score.slur(data)
+        self.since_last_write += 1
+
+        if self.since_last_write >= self.every:
+            self.write()
+
+    def write(self):
+        """Schedules the writing of a snapshot for the current score."""
+        tree = play_score(self.m, self.score)
+        with self.condition:
+            self.pending = tree
+            self.condition.notify()
+
+        self.since_last_write = 0
+
+    def close(self):
+        """Writes the last snapshot (if there is anything new), and waits until it's written. Idempotent."""
+        if self.closed:
+            return
+
+        if self.since_last_write > 0 or (self.pending is None and not os.path.isfile(self.filename)):
+            self.write()
+
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+        self.thread.join()
+
+        if self.error is not None:
+            raise self.error
+
+    def _write_in_background(self):
+        while True:
+            with self.condition:
+                while self.pending is None and not self.closed:
+                    self.condition.wait()
+
+                tree, self.pending = self.pending, None
+
+            if tree is None:
+                return  # closed, and nothing left to write
+
+            try:
+                write_snapshot(self.filename, tree)
+            except Exception as e:
+                # Snapshots are an optimization only: we keep on trying (the next one may succeed); reported on close()
+                self.error = e
+
+
+def load_snapshot(m, filename, score):
+    """Loads the file's snapshot (if any, and if it matches `score`) into the construct-memoization, such that
+    `play_score(m, score)` only needs to play the notes after the snapshot. Returns the number of notes thus skipped."""
+    snapshot = read_snapshot(snapshot_filename(filename), score)
+    if snapshot is None:
+        return 0
+
+    root_score, tree = snapshot
+    m.construct[root_score] = tree
+    return len(root_score)
 
 
 def read_from_file(filename, channel):
-    byte_stream = iter(open(filename, 'rb').read())
-    for note in all_notes_from_stream(byte_stream):
+    """Broadcasts each note in the file separately; for the initial read of (large) files prefer
+    `read_notes_from_file` in combination with `Score.slur_many` (which avoids the per-note fan-out)."""
+    for note in read_notes_from_file(filename):
         channel.broadcast(note)
 
 
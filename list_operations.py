@@ -3,27 +3,41 @@ Contains some typical operations to construct new lists based on existing ones (
 
 These are often used when constructing trees of various types; but because the trees might have multiple such lists,
 we've factored out the common operations.
+
+The operations work on both plain python lists (which are copied) and PVectors (which share structure between the
+original and the result); l_become creates a PVector.
 """
 
+from pvector import PVector
+
 
 def l_become():
     """Trivial, included for reasons of symmetry"""
-    return []
+    return PVector()
 
 
 def l_insert(l, index, new_element):
+    if isinstance(l, PVector):
+        return l.insert(index, new_element)
+
     result = l[:]
     result.insert(index, new_element)
     return result
 
 
 def l_delete(l, index):
+    if isinstance(l, PVector):
+        return l.delete(index)
+
     result = l[:]
     del result[index]
     return result
 
 
 def l_replace(l, index, new_element):
+    if isinstance(l, PVector):
+        return l.replace(index, new_element)
+
     result = l[:]
     result[index] = new_element
     return result
@@ -10,8 +10,17 @@ particular point in time. This is answered in the nerfy world including the "glo
 component of the cache lookup (sometimes: as the only component).
 
 Assuming that we don't have infinite storage space for our caches, this still leaves other cache-related questions open
-though, such as the question "which caches must be kept around?" (Cache replacement policies) I currently have no such
-policy (we use up as much space as we need).
+though, such as the question "which caches must be kept around?" (Cache replacement policies). Each memoized function
+has its own Cache, with a pluggable policy:
+
+* Unbounded: use up as much space as we need (the original approach).
+* LRU: keep the `max_entries` most recently used entries.
+* SizeBounded: idem, but bounded by the (estimated) total size in bytes of the values; the estimate is provided by the
+  caller, because it depends on the kind of values (and on what part of them is shared with other values).
+* KeepEveryKth: for caches keyed by Score; keep the entries for every k-th score, and the other ones in a (small) LRU
+  window. Because `play_score` walks back to the most recent memoized score, it remains resumable: at most k - 1 notes
+  need to be replayed for any score that dropped out of the window. N.B. this is not bounded by default: the number
+  of checkpoints grows linearly with the length of the history (1/k per note); see `max_checkpoints`.
 
 There's also the following idea: if you can just make it faster, rather than caching stuff, that's always preferred.
 Said differently: caching buys you some performance for storage space, but it's a cheap replacement for thinking hard
@@ -26,10 +35,250 @@ we are not yet explicit about which functions rely on this fact for decent perfo
 """
 
 
+from collections import OrderedDict
+from itertools import islice
+
+
+class Unbounded(object):
+
+    def accessed(self, cache, key):
+        pass
+
+    def added(self, cache, key, value):
+        return []
+
+
+class LRU(object):
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+
+    def accessed(self, cache, key):
+        cache.data.move_to_end(key)
+
+    def added(self, cache, key, value):
+        cache.data.move_to_end(key)  # setting an existing key counts as using it
+        return list(islice(cache.data, max(0, len(cache.data) - self.max_entries)))
+
+
+class SizeBounded(object):
+    """LRU, but bounded by the estimated size of the values, as given by `size_of` (value -> bytes). There is no
+    default: a shallow estimate such as sys.getsizeof counts only the top-level object of a tree or score, and a deep
+    one counts the structure that our trees share with each other once for each tree; which one is meaningful depends
+    on the values at hand."""
+
+    def __init__(self, max_bytes, size_of):
+        self.max_bytes = max_bytes
+        self.size_of = size_of
+        self.sizes = {}
+        self.total = 0
+
+    def accessed(self, cache, key):
+        cache.data.move_to_end(key)
+
+    def added(self, cache, key, value):
+        cache.data.move_to_end(key)
+        self.total += self.size_of(value) - self.sizes.get(key, 0)
+        self.sizes[key] = self.size_of(value)
+
+        result = []
+        keys = iter(cache.data)
+        while self.total > self.max_bytes and len(result) < len(cache.data) - 1:  # never evict the just-added entry
+            evict = next(keys)
+            self.total -= self.sizes.pop(evict)
+            result.append(evict)
+        return result
+
+    def cleared(self):
+        self.sizes = {}
+        self.total = 0
+
+
+class KeepEveryKth(object):
+    """For caches keyed by Scores (or anything else that has a len()): checkpoints (every k-th length) are kept; the
+    `recent` most recently used other entries are kept too.
+
+    By default all checkpoints are kept forever, i.e. the cache grows linearly (1 entry per k) with the length of the
+    history. With `max_checkpoints`, k is doubled each time the number of checkpoints would exceed it (dropping the
+    checkpoints that are no longer a multiple of k); which bounds the size of the cache, at the price of more notes to
+    replay (at most k - 1 for the k at that time)."""
+
+    def __init__(self, k, recent, max_checkpoints=None):
+        self.k = k
+        self.recent = recent
+        self.max_checkpoints = max_checkpoints
+        self.window = OrderedDict()  # the keys of the non-checkpoints, in LRU order
+        self.checkpoints = {}  # used as an (insertion-)ordered set
+
+    def is_checkpoint(self, key):
+        return len(key) % self.k == 0
+
+    def accessed(self, cache, key):
+        if not self.is_checkpoint(key):
+            self.window.move_to_end(key)
+
+    def added(self, cache, key, value):
+        if self.is_checkpoint(key):
+            self.checkpoints[key] = None
+            return self._thinned_checkpoints()
+
+        self.window[key] = None
+        self.window.move_to_end(key)
+
+        result = []
+        while len(self.window) > self.recent:
+            evict, _ = self.window.popitem(last=False)
+            result.append(evict)
+        return result
+
+    def _thinned_checkpoints(self):
+        result = []
+        while self.max_checkpoints is not None and len(self.checkpoints) > self.max_checkpoints:
+            self.k *= 2
+            result.extend(key for key in self.checkpoints if not self.is_checkpoint(key))
+            self.checkpoints = {key: None for key in self.checkpoints if self.is_checkpoint(key)}
+        return result
+
+    def cleared(self):
+        self.window.clear()
+        self.checkpoints = {}
+
+
+class Cache(object):
+    """A dict-like memoization table, with a replacement policy and hit/miss/eviction counters. Only the subset of the
+    dict-interface that's actually used for memoization is provided:
+
+    >>> cache = Cache(LRU(2))
+    >>> cache['a'] = 1
+    >>> cache['b'] = 2
+    >>> 'a' in cache
+    True
+    >>> cache['a']
+    1
+    >>> cache['c'] = 3
+    >>> 'b' in cache
+    False
+    >>> sorted(cache.keys())
+    ['a', 'c']
+
+    Hits are counted on lookup; misses when a value for a new key is stored (i.e. had to be computed). Checking for a
+    key by itself counts as neither: play_score checks any number of scores before it finds a memoized one.
+
+    >>> cache.stats()
+    {'entries': 2, 'hits': 1, 'misses': 3, 'evictions': 1}
+
+    Setting an existing key counts as using it:
+
+    >>> cache['a'] = 4
+    >>> cache['d'] = 5
+    >>> sorted(cache.keys())
+    ['a', 'd']
+
+    Keeping every k-th entry (by length) forever:
+
+    >>> cache = Cache(KeepEveryKth(3, recent=1))
+    >>> for i in range(1, 8):
+    ...     cache["x" * i] = i
+    >>> sorted(cache.data.values())
+    [3, 6, 7]
+
+    ... which is unbounded, unless the number of checkpoints is capped; in which case they are thinned out:
+
+    >>> cache = Cache(KeepEveryKth(2, recent=1, max_checkpoints=3))
+    >>> for i in range(1, 14):
+    ...     cache["x" * i] = i
+    >>> sorted(cache.data.values()), cache.policy.k
+    ([4, 8, 12, 13], 4)
+
+    Bounded by size:
+
+    >>> cache = Cache(SizeBounded(10, size_of=len))
+    >>> cache[1] = "abcd"
+    >>> cache[2] = "efgh"
+    >>> cache[3] = "ijkl"
+    >>> sorted(cache.keys())
+    [2, 3]
+    """
+
+    def __init__(self, policy=None):
+        self.policy = Unbounded() if policy is None else policy
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __getitem__(self, key):
+        result = self.data[key]
+        self.hits += 1
+        self.policy.accessed(self, key)
+        return result
+
+    def __setitem__(self, key, value):
+        # The memoization-pattern is `if key in cache: return cache[key]`, followed by computing & storing the value.
+        if key not in self.data:
+            self.misses += 1
+        self.data[key] = value
+
+        for evict in self.policy.added(self, key, value):
+            del self.data[evict]
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def keys(self):
+        return self.data.keys()
+
+    def clear(self):
+        self.data.clear()
+        if hasattr(self.policy, 'cleared'):
+            self.policy.cleared()
+
+    def stats(self):
+        return {'entries': len(self.data), 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
 class Memoization(object):
     """Single point of access for all memoized functions"""
 
     def __init__(self):
-        self.construct = {}
-        self.construct_nerd = {}
-        self.texture_for_text = {}
+        self.caches = {}
+
+        # At most 63 notes need to be replayed for any score; the most recent (i.e. the ones around the cursor in the
+        # history) are kept too.
+        self.register('construct', KeepEveryKth(64, recent=1024))
+        self.register('construct_nerd', KeepEveryKth(64, recent=1024))
+        self.register('construct_global_address', KeepEveryKth(64, recent=1024))
+
+        self.register('texture_for_text', LRU(4096))
+
+    def register(self, name, policy=None):
+        """Registers a new memoized function; its Cache is available as an attribute of the given name."""
+        if name in self.caches:
+            raise Exception("Memoized function already registered: %s" % name)
+
+        return self._set_cache(name, Cache(policy))
+
+    def set_policy(self, name, policy):
+        """Swaps the replacement policy of an already registered memoized function (e.g. in tests & benchmarks). Starts
+        from an empty Cache: the bookkeeping of the old policy does not carry over to the new one."""
+        if name not in self.caches:
+            raise Exception("Memoized function not registered: %s" % name)
+
+        return self._set_cache(name, Cache(policy))
+
+    def _set_cache(self, name, cache):
+        self.caches[name] = cache
+        setattr(self, name, cache)
+        return cache
+
+    def stats(self):
+        return {name: cache.stats() for name, cache in self.caches.items()}
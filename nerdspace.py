@@ -92,8 +92,16 @@ Deletion in the middle
 ['NONE', 'd', 'NONE', 'NONE', 'e']
 
 >>> sn_sanity(n2s, s2n)
+
+The same operations work on plain lists
+>>> sn_insert_right([None, 0, None, None, 1], [1, 4], 1)
+([None, 0, None, None, 1, 2], [1, 4, 5], 4)
+>>> sn_from_lists([None, 0, None, None, 1], [1, 4]) == ([None, 0, None, None, 1], [1, 4])
+True
 """
 
+from pvector import ListView, WeightedPVector
+
 
 def sn_sanity(n2s, s2n):
     for (n, s) in enumerate(n2s):
@@ -103,9 +111,58 @@ def sn_sanity(n2s, s2n):
         assert 0 <= n <= len(n2s) - 1 and n2s[n] == s, "%s <X> %s" % (s2n, n2s)
 
 
+class N2S(ListView):
+    """n2s and s2n are views on a single WeightedPVector, in which the live elements (in nerdspace) have weight 1 and
+    the tombstones have weight 0. s for a given n is the rank of n; n for a given s is select(s). Each of these, as well
+    as the changes, is O(log n) and shares structure with the previous version."""
+
+    def __len__(self):
+        return len(self.state)
+
+    def __getitem__(self, n):
+        if isinstance(n, slice):
+            return list(self)[n]
+
+        return self.state.rank(n) if self.state[n] else None
+
+    def __iter__(self):
+        s = 0
+        for alive in self.state:
+            if alive:
+                yield s
+                s += 1
+            else:
+                yield None
+
+
+class S2N(ListView):
+
+    def __len__(self):
+        return self.state.weight()
+
+    def __getitem__(self, s):
+        if isinstance(s, slice):
+            return list(self)[s]
+
+        if s < 0:
+            s += self.state.weight()
+        return self.state.select(s)
+
+    def __iter__(self):
+        return (n for (n, alive) in enumerate(self.state) if alive)
+
+
+def _views(alive):
+    return N2S(alive), S2N(alive)
+
+
+def sn_from_lists(n2s, s2n):
+    """Converts a pair of plain lists into the (equivalent) N2S, S2N pair."""
+    return _views(WeightedPVector([0 if s is None else 1 for s in n2s]))
+
+
 def sn_become():
-    # trivial; introduced here for reasons of symmetry
-    return [], []
+    return _views(WeightedPVector())
 
 
 def sn_insert_left(prev_n2s, prev_s2n, index):
@@ -119,12 +176,7 @@ def sn_insert_left(prev_n2s, prev_s2n, index):
         left_neighbor_in_n = prev_s2n[left_neighbor]
         index_in_n = left_neighbor_in_n + 1
 
-    n2s = _shift_some(prev_n2s, index, 1)
-    n2s.insert(index_in_n, index)
-
-    s2n = _shift_some(prev_s2n, index_in_n, 1)
-    s2n.insert(index, index_in_n)
-
+    n2s, s2n = _insert(prev_n2s, prev_s2n, index, index_in_n)
     return n2s, s2n, index_in_n
 
 
@@ -136,21 +188,34 @@ def sn_insert_right(prev_n2s, prev_s2n, index):
     else:
         index_in_n = prev_s2n[index]
 
+    n2s, s2n = _insert(prev_n2s, prev_s2n, index, index_in_n)
+    return n2s, s2n, index_in_n
+
+
+sn_insert = sn_insert_left
+
+
+def _insert(prev_n2s, prev_s2n, index, index_in_n):
+    if not isinstance(prev_n2s, list):
+        return _views(prev_n2s.state.insert(index_in_n, 1))
+
+    # Plain lists (e.g. constructed by hand) are still supported, in O(n) time.
     n2s = _shift_some(prev_n2s, index, 1)
     n2s.insert(index_in_n, index)
 
     s2n = _shift_some(prev_s2n, index_in_n, 1)
     s2n.insert(index, index_in_n)
 
-    return n2s, s2n, index_in_n
-
-
-sn_insert = sn_insert_left
+    return n2s, s2n
 
 
 def sn_delete(prev_n2s, prev_s2n, index):
     index_in_n = prev_s2n[index]  # 0 <= index < len(prev_s2n) => we can do this lookup
 
+    if not isinstance(prev_n2s, list):
+        n2s, s2n = _views(prev_n2s.state.replace(index_in_n, 0))
+        return n2s, s2n, index_in_n
+
     n2s = _shift_some(prev_n2s, index, -1)
     n2s[index_in_n] = None
 
@@ -164,6 +229,9 @@ def sn_replace(prev_n2s, prev_s2n, index):
     # trivial, introduced here for reasons of symmetry;
 
     index_in_n = prev_s2n[index]  # 0 <= index < len(prev_s2n) => we can do this lookup
+    if not isinstance(prev_n2s, list):
+        return prev_n2s, prev_s2n, index_in_n  # immutable; no need to copy
+
     return prev_n2s[:], prev_s2n[:], index_in_n
 
 
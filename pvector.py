@@ -0,0 +1,397 @@
+"""
+A persistent vector: an immutable sequence for which "changing" (inserting, deleting or replacing) a single element
+creates a new version in O(log n) time and memory; unchanged parts are shared between the versions.
+
+This matters for the children of our trees: each played note creates a new version of the list of children (and all
+versions are kept around in the memoization); with plain python lists each such version is a full copy.
+
+Implemented as a chunked B-tree: the elements are stored in leaves of at most CHUNK elements, which are the children of
+branches of at most CHUNK children, and so on. A branch knows the cumulative sizes of its children, which is what makes
+indexing logarithmic.
+
+>>> v = PVector(range(5))
+>>> v
+[0, 1, 2, 3, 4]
+>>> v.insert(2, 'x')
+[0, 1, 'x', 2, 3, 4]
+>>> v.delete(0)
+[1, 2, 3, 4]
+>>> v.replace(4, 'y')
+[0, 1, 2, 3, 'y']
+
+The original version is unaffected by the above:
+
+>>> v
+[0, 1, 2, 3, 4]
+>>> len(v), v[1], v[-1], v[1:3]
+(5, 1, 4, [1, 2])
+>>> v == [0, 1, 2, 3, 4]
+True
+
+Larger vectors (more than a single chunk) behave exactly like lists:
+
+>>> l = list(range(1000))
+>>> v = PVector(l)
+>>> for i in range(0, 2000, 7):
+...     l.insert(i % (len(l) + 1), -i)
+...     v = v.insert(i % (len(v) + 1), -i)
+>>> for i in range(0, 1500, 3):
+...     del l[i % len(l)]
+...     v = v.delete(i % len(v))
+>>> for i in range(0, 700, 5):
+...     l[i] = 'r%s' % i
+...     v = v.replace(i, 'r%s' % i)
+>>> v == l, len(v) == len(l), [v[i] for i in range(len(v))] == l
+(True, True, True)
+
+Multiple elements can be replaced in one go:
+
+>>> for i in range(100, 400, 3):
+...     l[i] = 'm%s' % i
+>>> v.replace_many([(i, 'm%s' % i) for i in range(100, 400, 3)]) == l
+True
+
+>>> v[len(v)]
+Traceback (most recent call last):
+IndexError: PVector index out of range
+"""
+
+from bisect import bisect_right
+
+# The maximum number of elements in a leaf, and of children in a branch. Small vectors (up to CHUNK elements) are a
+# single leaf; i.e. for those, each change is a copy of at most CHUNK elements, just like with plain lists.
+CHUNK = 32
+
+
+class _Leaf(object):
+    __slots__ = ('items', 'size')
+
+    def __init__(self, items):
+        self.items = items
+        self.size = len(items)
+
+    def width(self):
+        return len(self.items)
+
+
+class _Branch(object):
+    __slots__ = ('children', 'ends', 'size')
+
+    def __init__(self, children):
+        self.children = children
+
+        # ends[k] is the index just past the last element in children[k]
+        self.ends = []
+        total = 0
+        for child in children:
+            total += child.size
+            self.ends.append(total)
+
+        self.size = total
+
+    def width(self):
+        return len(self.children)
+
+    def locate(self, index):
+        """Returns (k, index in children[k]) for the index; at the boundary of 2 children, the latter is picked. For
+        index == size (i.e. inserting at the end), the last child is picked."""
+        k = min(bisect_right(self.ends, index), len(self.children) - 1)
+        return k, (index - self.ends[k - 1] if k > 0 else index)
+
+
+def _split(node_class, elements):
+    if len(elements) <= CHUNK:
+        return [node_class(elements)]
+
+    half = len(elements) // 2
+    return [node_class(elements[:half]), node_class(elements[half:])]
+
+
+def _insert(node, index, value):
+    """Returns a list of 1 or 2 nodes (2 in case of a split)"""
+    if isinstance(node, _Leaf):
+        items = node.items[:]
+        items.insert(index, value)
+        return _split(type(node), items)
+
+    k, child_index = node.locate(index)
+    children = node.children[:k] + _insert(node.children[k], child_index, value) + node.children[k + 1:]
+    return _split(type(node), children)
+
+
+def _merge(a, b):
+    if isinstance(a, _Leaf):
+        return type(a)(a.items + b.items)
+    return type(a)(a.children + b.children)
+
+
+def _delete(node, index):
+    if isinstance(node, _Leaf):
+        items = node.items[:]
+        del items[index]
+        return type(node)(items)
+
+    k, child_index = node.locate(index)
+    child = _delete(node.children[k], child_index)
+    children = node.children[:]
+
+    if child.size == 0:
+        del children[k]
+        return type(node)(children)
+
+    children[k] = child
+
+    # Nodes that become small are merged with a neighbour (if the two fit in a single node), such that long sequences of
+    # deletions don't leave a tree of tiny nodes behind.
+    if child.width() < CHUNK // 4:
+        for j in (k - 1, k):
+            if 0 <= j and j + 1 < len(children) and children[j].width() + children[j + 1].width() <= CHUNK:
+                children[j:j + 2] = [_merge(children[j], children[j + 1])]
+                break
+
+    return type(node)(children)
+
+
+def _replace(node, index, value):
+    if isinstance(node, _Leaf):
+        items = node.items[:]
+        items[index] = value
+        return type(node)(items)
+
+    k, child_index = node.locate(index)
+    children = node.children[:]
+    children[k] = _replace(children[k], child_index, value)
+    return type(node)(children)
+
+
+def _replace_many(node, pairs):
+    """pairs: a non-empty list of (index, value), sorted by index; each node on the paths to those indices is copied
+    once (rather than once per pair)."""
+    if isinstance(node, _Leaf):
+        items = node.items[:]
+        for index, value in pairs:
+            items[index] = value
+        return type(node)(items)
+
+    children = node.children[:]
+    i = 0
+    while i < len(pairs):
+        k, _ = node.locate(pairs[i][0])
+        start = node.ends[k - 1] if k > 0 else 0
+
+        j = i
+        while j < len(pairs) and pairs[j][0] < node.ends[k]:
+            j += 1
+
+        children[k] = _replace_many(children[k], [(index - start, value) for (index, value) in pairs[i:j]])
+        i = j
+
+    return type(node)(children)
+
+
+def _build(elements, leaf_class, branch_class):
+    nodes = [leaf_class(elements[i:i + CHUNK]) for i in range(0, len(elements), CHUNK)]
+    if not nodes:
+        return leaf_class([])
+
+    while len(nodes) > 1:
+        nodes = [branch_class(nodes[i:i + CHUNK]) for i in range(0, len(nodes), CHUNK)]
+
+    return nodes[0]
+
+
+class PVector(object):
+    """Matches the (non-mutating part of the) interface of python lists; changes are made using insert/delete/replace,
+    each of which returns a new PVector."""
+
+    __slots__ = ('root',)
+
+    _leaf_class = _Leaf
+    _branch_class = _Branch
+
+    def __init__(self, elements=()):
+        self.root = _build(list(elements), self._leaf_class, self._branch_class)
+
+    @classmethod
+    def _from_root(cls, root):
+        # Drop the levels that have become superfluous (by deletion)
+        while isinstance(root, _Branch) and len(root.children) <= 1:
+            root = root.children[0] if root.children else cls._leaf_class([])
+
+        result = cls.__new__(cls)
+        result.root = root
+        return result
+
+    def __len__(self):
+        return self.root.size
+
+    def _normalized_index(self, index):
+        if index < 0:
+            index += self.root.size
+
+        if not (0 <= index < self.root.size):
+            raise IndexError("PVector index out of range")
+
+        return index
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+
+        index = self._normalized_index(index)
+
+        node = self.root
+        while isinstance(node, _Branch):
+            k = bisect_right(node.ends, index)
+            if k > 0:
+                index -= node.ends[k - 1]
+            node = node.children[k]
+
+        return node.items[index]
+
+    def __iter__(self):
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, _Leaf):
+                yield from node.items
+            else:
+                stack.extend(reversed(node.children))
+
+    def __eq__(self, other):
+        if not isinstance(other, (PVector, list)):
+            return False
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    __hash__ = None  # like lists
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def insert(self, index, value):
+        """Returns a new PVector with value inserted before index; index == len(self) means: append."""
+        if not (0 <= index <= self.root.size):
+            raise IndexError("PVector index out of range")
+
+        nodes = _insert(self.root, index, value)
+        return self._from_root(nodes[0] if len(nodes) == 1 else self._branch_class(nodes))
+
+    def delete(self, index):
+        return self._from_root(_delete(self.root, self._normalized_index(index)))
+
+    def replace(self, index, value):
+        return self._from_root(_replace(self.root, self._normalized_index(index), value))
+
+    def replace_many(self, pairs):
+        """Like a number of calls to replace, given as (index, value) pairs; but shares the work of copying the paths
+        that the replaced elements have in common (i.e. for k consecutive elements this is O(k + log n))."""
+        pairs = sorted(((self._normalized_index(index), value) for (index, value) in pairs), key=lambda p: p[0])
+        if not pairs:
+            return self
+        return self._from_root(_replace_many(self.root, pairs))
+
+
+class _WeightedLeaf(_Leaf):
+    __slots__ = ('weight',)
+
+    def __init__(self, items):
+        super(_WeightedLeaf, self).__init__(items)
+        self.weight = sum(items)
+
+
+class _WeightedBranch(_Branch):
+    __slots__ = ('weight_ends', 'weight')
+
+    def __init__(self, children):
+        super(_WeightedBranch, self).__init__(children)
+
+        # weight_ends[k] is the total weight of children[:k + 1]
+        self.weight_ends = []
+        total = 0
+        for child in children:
+            total += child.weight
+            self.weight_ends.append(total)
+
+        self.weight = total
+
+
+class WeightedPVector(PVector):
+    """A PVector of non-negative integer weights (typically: 0 and 1), which additionally knows the cumulative weights.
+    For 0/1-weights this gives us rank & select in O(log n).
+
+    >>> v = WeightedPVector([1, 0, 0, 1, 1, 0, 1])
+    >>> v.weight(), [v.rank(i) for i in range(len(v) + 1)], [v.select(k) for k in range(v.weight())]
+    (4, [0, 1, 1, 1, 2, 3, 3, 4], [0, 3, 4, 6])
+
+    >>> v = WeightedPVector([i % 3 == 0 for i in range(1000)]).replace(0, 0).insert(500, 1)
+    >>> v.rank(501), v.select(166), v.select(167)
+    (167, 500, 502)
+    """
+
+    __slots__ = ()
+
+    _leaf_class = _WeightedLeaf
+    _branch_class = _WeightedBranch
+
+    def weight(self):
+        return self.root.weight
+
+    def rank(self, index):
+        """The total weight of the elements before index."""
+        if not (0 <= index <= len(self)):
+            raise IndexError("PVector index out of range")
+
+        result = 0
+        node = self.root
+        while isinstance(node, _Branch):
+            if index >= node.size:
+                return result + node.weight
+
+            k = bisect_right(node.ends, index)
+            if k > 0:
+                result += node.weight_ends[k - 1]
+                index -= node.ends[k - 1]
+            node = node.children[k]
+
+        return result + sum(node.items[:index])
+
+    def select(self, k):
+        """The index of the element at which the cumulative weight (including that element) first exceeds k; for
+        0/1-weights: the index of the k-th (0-based) element of weight 1."""
+        if not (0 <= k < self.root.weight):
+            raise IndexError("Select out of range: %s" % k)
+
+        index = 0
+        node = self.root
+        while isinstance(node, _Branch):
+            j = bisect_right(node.weight_ends, k)
+            if j > 0:
+                k -= node.weight_ends[j - 1]
+                index += node.ends[j - 1]
+            node = node.children[j]
+
+        for i, item in enumerate(node.items):
+            if k < item:
+                return index + i
+            k -= item
+
+
+class ListView(object):
+    """Read-only access, as a list, to some persistent structure (the `state`); used for the bookkeeping (t2s/s2t and
+    n2s/s2n) that used to be plain lists. Subclasses provide __len__, __getitem__ and __iter__; views repr & compare
+    like the lists they replace."""
+
+    __slots__ = ('state',)
+
+    def __init__(self, state):
+        self.state = state
+
+    def __eq__(self, other):
+        if not isinstance(other, (ListView, list)):
+            return False
+        return list(self) == list(other)
+
+    __hash__ = None  # like lists
+
+    def __repr__(self):
+        return repr(list(self))
@@ -26,8 +26,32 @@ Delete the first item (s_address 0, t_address 0)
 >>> t2s, s2t = st_delete(t2s, s2t, 0)
 >>> t2s, s2t
 ([None, None, 0], [2])
+
+Insert repeatedly in between 2 items
+>>> t2s, s2t = st_insert(t2s, s2t, 1)
+>>> t2s, s2t = st_insert(t2s, s2t, 1)
+>>> t2s, s2t = st_insert(t2s, s2t, 2)
+>>> t2s, s2t
+([None, None, 0, 3, 1, 2], [2, 4, 5, 3])
+>>> st_sanity(t2s, s2t)
+
+Inserting in the same gap over and over again (e.g. typing) doesn't make the labels grow (see _SpaceTime)
+>>> for i in range(2000):
+...     t2s, s2t = st_insert(t2s, s2t, 2)
+>>> st_sanity(t2s, s2t)
+>>> max(label.bit_length() for (label, t) in t2s.state.live) <= LABEL_BITS
+True
+
+The same operations work on plain lists
+>>> t2s, s2t = st_insert([None, None, 0], [2], 1)
+>>> t2s, s2t
+([None, None, 0, 1], [2, 3])
+>>> st_from_lists(t2s, s2t) == (t2s, s2t)
+True
 """
 
+from pvector import ListView, PVector
+
 
 def st_sanity(t2s, s2t):
     for (t, s) in enumerate(t2s):
@@ -37,30 +61,188 @@ def st_sanity(t2s, s2t):
         assert 0 <= t <= len(t2s) - 1 and t2s[t] == s, "%s <X> %s" % (s2t, t2s)
 
 
+# Labels are integers in [0, 2 ** bits); see _SpaceTime. The density threshold is the T of the relabeling scheme: a
+# range of size 2 ** i may contain at most (2 / T) ** i labels; any T in (1, 2) gives amortized O(log n) relabelings.
+LABEL_BITS = 62
+DENSITY_THRESHOLD = 1.5
+
+# The distance between a label and a new one that's put next to it at either end.
+END_STEP = 2 ** 32
+
+
+class _SpaceTime(object):
+    """The (immutable) state behind a T2S/S2T pair.
+
+    Each child that's ever been created (i.e. each t) has a label; the labels of the live children are ordered the same
+    way as the children are in space. Its s is the rank of its label among the live labels. Both t2label and live (the
+    (label, t) pairs of the live children, in s-order) are PVectors, which share structure between the versions.
+
+    Labels are bounded integers (order maintenance, as in Bender et al., "Two simplified algorithms for maintaining
+    order in a list"): an insertion picks a label in between those of its neighbours; if there is no room for that, the
+    smallest enclosing (aligned) range of labels that is sparse enough is relabeled evenly. This costs amortized
+    O(log n) relabelings per insertion, each of which is an O(log n) PVector change. When even the full range of labels
+    is too dense, the number of bits is increased."""
+
+    __slots__ = ('t2label', 'live', 'bits')
+
+    def __init__(self, t2label, live, bits=None):
+        self.t2label = t2label
+        self.live = live
+        self.bits = LABEL_BITS if bits is None else bits
+
+    def s_for_label(self, label):
+        # Binary search in the live labels; these are unique, so an exact match is guaranteed.
+        lo, hi = 0, len(self.live)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.live[mid][0] < label:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def insert(self, index):
+        """Returns a new _SpaceTime, with a new t inserted at s == index."""
+        t = len(self.t2label)
+
+        left = self.live[index - 1][0] if index > 0 else -1
+        right = self.live[index][0] if index < len(self.live) else 2 ** self.bits
+
+        if right - left >= 2:
+            # In the middle: bisect the gap. At the ends (i.e. appending, the typical case), leave room for many more.
+            if index == len(self.live) and index > 0:
+                label = left + min((right - left) // 2, END_STEP)
+            elif index == 0 and index < len(self.live):
+                label = right - min((right - left) // 2, END_STEP)
+            else:
+                label = (left + right) // 2
+            return _SpaceTime(self.t2label.insert(t, label), self.live.insert(index, (label, t)), self.bits)
+
+        # No room: insert with a temporary (equal) label and relabel a range around it.
+        anchor = left if index > 0 else right
+        result = _SpaceTime(self.t2label.insert(t, anchor), self.live.insert(index, (anchor, t)), self.bits)
+        return result._relabeled_around(index, anchor)
+
+    def _relabeled_around(self, index, anchor):
+        # The ranges of labels that we consider are nested; the live labels in them are found by scanning outwards from
+        # index. Hence the total cost of scanning is proportional to the number of relabeled labels.
+        s_lo, s_hi = index, index + 1
+
+        for i in range(1, self.bits + 1):
+            lo = (anchor >> i) << i
+            hi = lo + 2 ** i
+
+            while s_lo > 0 and self.live[s_lo - 1][0] >= lo:
+                s_lo -= 1
+            while s_hi < len(self.live) and self.live[s_hi][0] < hi:
+                s_hi += 1
+
+            if s_hi - s_lo <= (2 / DENSITY_THRESHOLD) ** i:
+                return self._relabeled(s_lo, s_hi, lo, hi, self.bits)
+
+        # Even the full range is too dense: grow it (all labels are relabeled).
+        bits = self.bits + 16
+        return self._relabeled(0, len(self.live), 0, 2 ** bits, bits)
+
+    def _relabeled(self, s_lo, s_hi, lo, hi, bits):
+        # Spread the labels of live[s_lo:s_hi] evenly over [lo, hi)
+        count = s_hi - s_lo
+        relabeled = [
+            (s, lo + ((2 * j + 1) * (hi - lo)) // (2 * count), self.live[s][1])
+            for j, s in enumerate(range(s_lo, s_hi))]
+
+        return _SpaceTime(
+            self.t2label.replace_many([(t, label) for (s, label, t) in relabeled]),
+            self.live.replace_many([(s, (label, t)) for (s, label, t) in relabeled]),
+            bits)
+
+
+class T2S(ListView):
+    """The t2s direction of a _SpaceTime."""
+
+    def __len__(self):
+        return len(self.state.t2label)
+
+    def __getitem__(self, t):
+        if isinstance(t, slice):
+            return list(self)[t]
+
+        label = self.state.t2label[t]
+        return None if label is None else self.state.s_for_label(label)
+
+    def __iter__(self):
+        result = [None] * len(self.state.t2label)
+        for s, (label, t) in enumerate(self.state.live):
+            result[t] = s
+        return iter(result)
+
+
+class S2T(ListView):
+    """The s2t direction of a _SpaceTime."""
+
+    def __len__(self):
+        return len(self.state.live)
+
+    def __getitem__(self, s):
+        if isinstance(s, slice):
+            return list(self)[s]
+
+        return self.state.live[s][1]
+
+    def __iter__(self):
+        return (t for (label, t) in self.state.live)
+
+
+def _views(st):
+    return T2S(st), S2T(st)
+
+
+def st_from_lists(t2s, s2t):
+    """Converts a pair of plain lists into the (equivalent) T2S, S2T pair."""
+    # To start with, the labels are spread evenly over the available range
+    def label(s):
+        return ((2 * s + 1) * 2 ** LABEL_BITS) // (2 * len(s2t))
+
+    return _views(_SpaceTime(
+        PVector([None if s is None else label(s) for s in t2s]),
+        PVector([(label(s), t) for (s, t) in enumerate(s2t)])))
+
+
 def st_become():
-    # trivial; introduced here for reasons of symmetry
-    return [], []
+    return _views(_SpaceTime(PVector(), PVector()))
 
 
 def st_insert(prev_t2s, prev_s2t, index):
-    t2s = [(i if i is None or i < index else i + 1) for i in prev_t2s] + [index]
-    s2t = prev_s2t[:]
-    s2t.insert(index, len(t2s) - 1)
-    return t2s, s2t
+    if isinstance(prev_t2s, list):
+        # Plain lists (e.g. constructed by hand) are still supported, in O(n) time.
+        t2s = [(i if i is None or i < index else i + 1) for i in prev_t2s] + [index]
+        s2t = prev_s2t[:]
+        s2t.insert(index, len(t2s) - 1)
+        return t2s, s2t
+
+    return _views(prev_t2s.state.insert(index))
 
 
 def st_delete(prev_t2s, prev_s2t, index):
-    t2s = [(i if (i is None or i < index) else i - 1) for i in prev_t2s]
-    t2s[prev_s2t[index]] = None
+    if isinstance(prev_t2s, list):
+        t2s = [(i if (i is None or i < index) else i - 1) for i in prev_t2s]
+        t2s[prev_s2t[index]] = None
 
-    s2t = prev_s2t[:]
-    del s2t[index]
-    return t2s, s2t
+        s2t = prev_s2t[:]
+        del s2t[index]
+        return t2s, s2t
+
+    st = prev_t2s.state
+    label, t = st.live[index]
+    return _views(_SpaceTime(st.t2label.replace(t, None), st.live.delete(index), st.bits))
 
 
 def st_replace(prev_t2s, prev_s2t, index):
     # trivial, introduced here for reasons of symmetry
-    return prev_t2s[:], prev_s2t[:]
+    if isinstance(prev_t2s, list):
+        return prev_t2s[:], prev_s2t[:]
+
+    return prev_t2s, prev_s2t  # immutable; no need to copy
 
 
 def t_address_for_s_address(node, s_address):
@@ -1,6 +1,10 @@
+import os
 import unittest
 import doctest
 
+# The type checks must be switched on before the first import of utils (see utils.TYPE_CHECKS)
+os.environ.setdefault("NERF1_TYPE_CHECKS", "1")
+
 import channel
 import spacetime
 import nerdspace
@@ -8,7 +12,11 @@ import vlq
 import utils
 import s_address
 import vim
+import pvector
+import memoization
 
+from dsn.history import ic_structure as history_ic_structure
+from dsn.pp import structure as pp_structure
 from dsn.viewports import utils as viewports_utils
 
 
@@ -21,7 +29,11 @@ def load_tests(loader, tests, ignore):
     tests.addTests(doctest.DocTestSuite(vlq))
     tests.addTests(doctest.DocTestSuite(s_address))
     tests.addTests(doctest.DocTestSuite(vim))
+    tests.addTests(doctest.DocTestSuite(memoization))
+    tests.addTests(doctest.DocTestSuite(pvector))
     tests.addTests(doctest.DocTestSuite(viewports_utils))
+    tests.addTests(doctest.DocTestSuite(pp_structure))
+    tests.addTests(doctest.DocTestSuite(history_ic_structure))
 
     # Some tests in the doctests style are too large to nicely fit into a docstring; better to keep them separate:
     tests.addTests(doctest.DocFileSuite("doctests/s_expr_clef_serialization.txt"))
@@ -33,6 +45,10 @@ def load_tests(loader, tests, ignore):
     tests.addTests(doctest.DocFileSuite("doctests/note_address.txt"))
     tests.addTests(doctest.DocFileSuite("doctests/spacetime.txt"))
     tests.addTests(doctest.DocFileSuite("doctests/nerd_spacetime.txt"))
+    tests.addTests(doctest.DocFileSuite("doctests/filehandler.txt"))
+    tests.addTests(doctest.DocFileSuite("doctests/snapshot.txt"))
+    tests.addTests(doctest.DocFileSuite("doctests/s_expr_score.txt"))
+    tests.addTests(doctest.DocFileSuite("doctests/pp_construct.txt"))
 
     return tests
 
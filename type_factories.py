@@ -1,18 +1,36 @@
 from binascii import hexlify
-from hashlib import sha256
+from hashlib import sha256, blake2b
 
-from utils import pmts, rfs
+from utils import pmts, rfs, rfb
 
 bytes_iterator = type(iter(bytes()))
 
 NOUT_CAPO = 0
 NOUT_SLUR = 1
 
+# The available algorithms for hashing; all of them produce 32-byte digests, such that the choice between them does not
+# affect the (fixed-width) storage of hashes. sha256 is the original one (and hardware-accelerated on most recent CPUs);
+# blake2b is faster in pure software. The algorithm is a property of each hash (rather than a global setting): a hash
+# chain (i.e. a history) is hashed throughout with the algorithm of its first hash, so histories with different
+# algorithms can be used side by side.
+HASH_ALGORITHMS = {
+    'sha256': sha256,
+    'blake2b': lambda bytes_: blake2b(bytes_, digest_size=32),
+}
+
+DEFAULT_HASH_ALGORITHM = 'sha256'
+
+
+def check_hash_algorithm(name):
+    if name not in HASH_ALGORITHMS:
+        raise ValueError("Unknown hash algorithm: %s" % name)
+
 
 def hash_factory(clazz, name_prefix):
 
     class HashPrototype(object):
-        def __init__(self, hash_bytes):
+
+        def __init__(self, hash_bytes, algorithm=DEFAULT_HASH_ALGORITHM):
             pmts(hash_bytes, bytes)
 
             # i.e. if you want to construct a hash _for_ a bunch of bytes, use 'for_bytes'
@@ -20,6 +38,13 @@ def hash_factory(clazz, name_prefix):
 
             self.hash_bytes = hash_bytes
 
+            # The algorithm with which the hash was made, i.e. the one for the hashes that build on it. Not part of the
+            # hash's identity (see __eq__): the chances of two algorithms' hashes colliding are nil.
+            self.algorithm = algorithm
+
+            # Hashes are used as (part of) the keys in Score.glob and the memoization; i.e. __hash__ is called a lot.
+            self._python_hash = None
+
         def __repr__(self):
             return str(hexlify(self.hash_bytes)[:12], 'utf-8')
 
@@ -27,16 +52,16 @@ def hash_factory(clazz, name_prefix):
             return self.hash_bytes
 
         @staticmethod
-        def for_object(serializable):
+        def for_object(serializable, algorithm=DEFAULT_HASH_ALGORITHM):
             pmts(serializable, clazz)
             bytes_ = serializable.as_bytes()
-            return Hash._for_bytes(bytes_)
+            return Hash._for_bytes(bytes_, algorithm)
 
         @staticmethod
-        def _for_bytes(bytes_):
+        def _for_bytes(bytes_, algorithm):
             pmts(bytes_, bytes)
-            hash_ = sha256(bytes_).digest()
-            return Hash(hash_)
+            hash_ = HASH_ALGORITHMS[algorithm](bytes_).digest()
+            return Hash(hash_, algorithm)
 
         @staticmethod
         def from_stream(byte_stream):
@@ -44,11 +69,19 @@ def hash_factory(clazz, name_prefix):
             pmts(byte_stream, bytes_iterator)
             return Hash(rfs(byte_stream, 32))
 
+        @staticmethod
+        def from_buffer(buffer, offset):
+            """_reads_ exactly 32 bytes from the buffer; returns the Hash and the new offset"""
+            hash_bytes, offset = rfb(buffer, offset, 32)
+            return Hash(bytes(hash_bytes)), offset
+
         def __hash__(self):
             # Based on the following understanding:
             # * AFAIK, Python's hash function works w/ 64-bit ints; hence I take 8 bytes
             # * byteorder was picked arbitrarily
-            return int.from_bytes(self.hash_bytes[:8], byteorder='big')
+            if self._python_hash is None:
+                self._python_hash = int.from_bytes(self.hash_bytes[:8], byteorder='big')
+            return self._python_hash
 
         def __eq__(self, other):
             if not isinstance(other, Hash):
@@ -79,6 +112,13 @@ def nout_factory(NoteClass, name_prefix):
                 NOUT_SLUR: Slur,
             }[byte0].from_stream(byte_stream)
 
+        @staticmethod
+        def from_buffer(buffer, offset):
+            return {
+                NOUT_CAPO: Capo,
+                NOUT_SLUR: Slur,
+            }[buffer[offset]].from_buffer(buffer, offset + 1)
+
     class CapoPrototype(object):
         def __init__(self):
             pass
@@ -93,6 +133,10 @@ def nout_factory(NoteClass, name_prefix):
         def from_stream(byte_stream):
             return Capo()
 
+        @staticmethod
+        def from_buffer(buffer, offset):
+            return Capo(), offset
+
         def __eq__(self, other):
             return isinstance(other, Capo)
 
@@ -114,6 +158,12 @@ def nout_factory(NoteClass, name_prefix):
         def from_stream(byte_stream):
             return Slur(NoteClass.from_stream(byte_stream), Hash.from_stream(byte_stream))
 
+        @staticmethod
+        def from_buffer(buffer, offset):
+            note, offset = NoteClass.from_buffer(buffer, offset)
+            previous_hash, offset = Hash.from_buffer(buffer, offset)
+            return Slur(note, previous_hash), offset
+
     # Construct a small hierarchy with "readable names" (names that don't betray that the classes are created inside a
     # method). N.B.: The unqualified names `Nout`, `Capo` and `Slur` are local to this method, after returning the fully
     # qualified name (including the prefix) is used.
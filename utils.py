@@ -1,18 +1,53 @@
-def pmts(v, type_, extra_information=""):
-    """Poor man's type system"""
-    assert isinstance(v, type_), "Expected value of type '%s' but is type '%s'%s" % (
-        type_.__name__,
-        type(v).__name__,
-        "" if not extra_information else "; %s" % extra_information
-        )
+import os
 
+# The poor man's type system (pmts) is a development aid; it's called from the constructors of (almost) all of our
+# objects, including the most numerous ones, so it's not free. It's only switched on when the environment variable
+# NERF1_TYPE_CHECKS is set to something other than "0" (tests.py does this); otherwise pmts and pmts_or_none are no-ops.
+# Because the other modules import these functions by name, the choice is made once, when this module is imported.
+#
+# TYPE_CHECKS is the single switch for such checks: it is independent of python's -O (pmts raises AssertionError
+# explicitly rather than using `assert`). Even as a no-op, a call to pmts is a python function call; in the hottest
+# places (e.g. the constructors of SExpr and NerdSExpr) the calls are therefore guarded with `if TYPE_CHECKS:` as well.
+TYPE_CHECKS = os.environ.get("NERF1_TYPE_CHECKS", "0") != "0"
 
-def pmts_or_none(v, type_, extra_information=""):
-    """Poor man's type system; value may be None"""
-    if v is not None:
-        pmts(v, type_, extra_information)
+if TYPE_CHECKS:
+    def pmts(v, type_, extra_information=""):
+        """Poor man's type system
+
+        >>> pmts("a", str)
+        >>> pmts(1, str, "the argument 'atom'")
+        Traceback (most recent call last):
+        AssertionError: Expected value of type 'str' but is type 'int'; the argument 'atom'
+        """
+        if not isinstance(v, type_):
+            raise AssertionError("Expected value of type '%s' but is type '%s'%s" % (
+                type_.__name__,
+                type(v).__name__,
+                "" if not extra_information else "; %s" % extra_information
+                ))
+
+    def pmts_or_none(v, type_, extra_information=""):
+        """Poor man's type system; value may be None"""
+        if v is not None:
+            pmts(v, type_, extra_information)
+
+else:
+    def pmts(v, type_, extra_information=""):
+        """Poor man's type system (switched off; see TYPE_CHECKS)"""
+
+    def pmts_or_none(v, type_, extra_information=""):
+        """Poor man's type system; value may be None (switched off; see TYPE_CHECKS)"""
 
 
 def rfs(byte_stream, n):
     # read n bytes from stream
     return bytes((next(byte_stream) for i in range(n)))
+
+
+def rfb(buffer, offset, n):
+    """read n bytes from buffer, starting at offset; returns the read bytes and the new offset.
+    For buffers of type memoryview the returned bytes are a (zero-copy) memoryview themselves."""
+    end = offset + n
+    if end > len(buffer):
+        raise IndexError("Buffer too short: cannot read %s bytes at offset %s" % (n, offset))
+    return buffer[offset:end], end
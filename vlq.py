@@ -14,6 +14,7 @@ arranged most significant first in a stream.
 >>> for i in interesting:
 ...     print("%12d: %s" % (i, to_vlq(i)))
 ...     assert from_vlq(iter(to_vlq(i))) == i
+...     assert from_vlq_buffer(b'X' + to_vlq(i), 1) == (i, 1 + len(to_vlq(i)))
 ...
            0: b'\x00'
            1: b'\x01'
@@ -25,25 +26,54 @@ arranged most significant first in a stream.
        16384: b'\x81\x80\x00'
   1234567890: b'\x84\xcc\xd8\x85R'
 
+Batches of integers can be encoded into (and decoded from) a single buffer:
+
+>>> encoded = to_vlqs(interesting)
+>>> encoded == b"".join(to_vlq(i) for i in interesting)
+True
+>>> from_vlqs(encoded)
+(array('Q', [0, 1, 42, 127, 128, 8192, 16383, 16384, 1234567890]), 18)
+
 """
 
+from array import array
+
 from utils import pmts
 
 
-def to_vlq(i):
+def write_vlq(buffer, i):
+    """Appends the VLQ-encoding of i to the bytearray `buffer`."""
     pmts(i, int)
-    needed_bytes = 1
-    result = b''
+    if i < 0:
+        raise ValueError("VLQs are unsigned: %s" % i)
 
-    while pow(128, needed_bytes) <= i:
-        needed_bytes += 1
+    shift = 7
+    while i >> shift:
+        shift += 7
 
-    mod = None
-    for j in reversed(range(needed_bytes)):
-        div = pow(128, j)
-        result += bytes([(i % mod if mod else i) // div + (128 if j > 0 else 0)])
-        mod = div
+    while shift > 7:
+        shift -= 7
+        buffer.append(((i >> shift) & 0x7f) | 0x80)
+
+    buffer.append(i & 0x7f)
+
+
+def to_vlq(i):
+    result = bytearray()
+    write_vlq(result, i)
+    return bytes(result)
 
+
+def to_vlqs(integers):
+    """
+    Encodes a sequence of integers into a single bytearray (the concatenation of their VLQs).
+
+    >>> to_vlqs([0, 1, 128, 1234567890])
+    bytearray(b'\\x00\\x01\\x81\\x00\\x84\\xcc\\xd8\\x85R')
+    """
+    result = bytearray()
+    for i in integers:
+        write_vlq(result, i)
     return result
 
 
@@ -60,3 +90,55 @@ def from_vlq(bytes_stream):
             return result
 
         result *= 128
+
+
+def from_vlq_buffer(buffer, offset):
+    # buffer is any indexable sequence of bytes (e.g. bytes, memoryview, mmap); returns the value and the new offset
+    result = 0
+
+    while True:
+        b = buffer[offset]
+        offset += 1
+
+        result += (b % 128)
+
+        if b < 128:
+            return result, offset
+
+        result *= 128
+
+
+def from_vlqs(buffer, offset=0, count=None):
+    """
+    Decodes `count` VLQs (default: all remaining VLQs) from the buffer in a single pass. Returns the values as an
+    array('Q') and the new offset.
+
+    >>> from_vlqs(b'X' + to_vlqs([0, 1, 128, 1234567890]), 1, 3)
+    (array('Q', [0, 1, 128]), 5)
+
+    >>> from_vlqs(b'\\x00\\x81')
+    Traceback (most recent call last):
+    IndexError: Buffer ends in the middle of a VLQ
+    """
+    result = array('Q')
+    append = result.append
+    end = len(buffer)
+
+    value = 0
+    in_vlq = False  # i.e. in the middle of a VLQ (the last byte consumed had its continuation bit set)
+    while offset < end and (count is None or len(result) < count):
+        b = buffer[offset]
+        offset += 1
+
+        if b < 128:
+            append(value + b)
+            value = 0
+            in_vlq = False
+        else:
+            value = (value + (b & 0x7f)) << 7
+            in_vlq = True
+
+    if in_vlq:
+        raise IndexError("Buffer ends in the middle of a VLQ")
+
+    return result, offset
@@ -13,7 +13,7 @@ from dsn.history.structure import EHStructure
 from dsn.s_expr.score import Score
 # from dsn.s_expr.construct import play_score
 from dsn.s_expr.structure import Atom, List
-from dsn.s_expr.clef_address import play_simple_score, score_with_global_address
+from dsn.s_expr.clef_address import play_score_with_global_address
 from dsn.s_expr.simple_score import SimpleScore
 from dsn.s_expr.note_address import els18_root_address, ELS18RenderingAddress
 
@@ -158,9 +158,7 @@ class HistoryWidget(FocusBehavior, Widget):
         self.update_score(data)
 
     def _local_score(self, score, tree_t_address):
-        annotated_score = score_with_global_address(score)
-
-        tree = play_simple_score(annotated_score)
+        tree = play_score_with_global_address(self.m, score)
         s_address = get_s_address_for_t_address(tree, tree_t_address)
 
         if s_address is None:
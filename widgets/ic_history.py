@@ -1,5 +1,6 @@
 from utils import pmts
 from functools import partial
+from weakref import WeakKeyDictionary
 
 from kivy.clock import Clock
 from kivy.core.text import Label
@@ -9,7 +10,7 @@ from kivy.uix.behaviors.focus import FocusBehavior
 from kivy.uix.widget import Widget
 
 from dsn.history.ic_construct import eich_note_play
-from dsn.history.ic_structure import EICHStructure
+from dsn.history.ic_structure import EICHStructure, LazyItems
 from dsn.pp.construct import construct_pp_nerd_tree
 from dsn.pp.structure import PPSingleLine
 from dsn.pp.in_context import (
@@ -61,6 +62,7 @@ from widgets.layout_constants import (
 )
 
 from dsn.viewports.structure import ViewportStructure, VRTC, ViewportContext
+from dsn.viewports.utils import estimated_size, window_around_cursor
 from dsn.viewports.construct import play_viewport_note
 from dsn.viewports.clef import (
     ViewportContextChange,
@@ -74,12 +76,12 @@ from dsn.viewports.clef import (
     VIEWPORT_LINE_UP,
 )
 
-from dsn.s_expr.construct import play_note as play_note_regularly
+from dsn.s_expr.construct import play_note as play_note_regularly, play_score
 from dsn.s_expr.nerd import NerdSExpr, play_note
 from dsn.s_expr.in_context_display import annotated_render_t0, PPAnnotatedInContextDisplay
 from dsn.s_expr.in_context_display import ICAtom, ICHAddress, InContextDisplay
 from dsn.s_expr.clef import Chord
-from dsn.s_expr.clef_address import play_simple_score, score_with_global_address
+from dsn.s_expr.clef_address import play_score_with_global_address
 from dsn.s_expr.simple_score import SimpleScore
 
 ANIMATION_LENGTH = .5  # Seconds
@@ -91,6 +93,12 @@ MARGIN = 0
 FOLLOWING = 0
 LEADING = 1
 
+# Only the items around the cursor are laid out (the rest of the document's size is estimated); this is the number of
+# items beyond what fits in the viewport (on either side) that are laid out nonetheless.
+WINDOW_MARGIN = 64
+
+INTER_ITEM_MARGIN = 20
+
 
 def _deepest(note):
     """Finds the 'single leaf of the tree' (our notes have either 1 or 0 children); the exception being 'Chord',
@@ -138,6 +146,21 @@ class ICGrouping(InContextDisplay):
         return " ".join(repr(c) for c in self.children)
 
 
+def _item_note_addresses(note, expanded_chords):
+    """The note addresses of the items that `note` is rendered as (without actually rendering anything)"""
+    deepest_node = _deepest(note)
+
+    if isinstance(deepest_node, Chord) and deepest_node.address in expanded_chords:
+        return [a for inner_note in deepest_node.score.notes for a in _item_note_addresses(inner_note, expanded_chords)]
+
+    return [deepest_node.address]
+
+
+def _global_index(note):
+    """The index in the global score of the note which `note` is (part of)."""
+    return note.address.address[0].index
+
+
 class HistoryWidget(FocusBehavior, Widget):
 
     def __init__(self, **kwargs):
@@ -167,7 +190,19 @@ class HistoryWidget(FocusBehavior, Widget):
         # AFAIU:
         # 1. We could basically set any value below.
 
-        self.ds = EICHStructure(Score.empty(), [], 0, [], set())
+        self.ds = EICHStructure(Score.empty(), LazyItems(), 0, [], set())
+
+        # SimpleScore (the score of a single note in the local score) => (context, items)
+        self._items_cache = WeakKeyDictionary()
+
+        # The average (vertical) size of an item, as measured on the previous layout; used to estimate how many items
+        # fit in the viewport, before doing the actual layout.
+        self._item_size_estimate = 40
+        self.window_start, self.window_end = 0, 0
+
+        # The laid out part of the document, in document coordinates: (top, bottom); and the size of the whole.
+        self.window_extent = (0, 0)
+        self.document_size = 0
 
         self.following_or_leading = FOLLOWING
         self.z_pressed = False
@@ -187,118 +222,137 @@ class HistoryWidget(FocusBehavior, Widget):
     def _best_new_cursor(self, prev_cursor, prev_items, new_items, default):
         """Finds a best new cursor given a previous cursor"""
 
-        searchfor = prev_items[prev_cursor].underlying_node.address.note_address
-        for i, item in enumerate(new_items):
-            if item.underlying_node.address.note_address == searchfor:
+        if not (0 <= prev_cursor < len(prev_items)):
+            return default
+
+        # note_addresses rather than the items themselves: no need to render anything to find the cursor.
+        searchfor = prev_items.note_addresses[prev_cursor]
+        for i, note_address in enumerate(new_items.note_addresses):
+            if note_address == searchfor:
                 return i
 
         return default
 
-    def _items(self, score, t_address, expanded_chords):
-        items = []
-        for s in reversed(list(score.scores())):
-            note_to_render = s.last_note()
-
-            scores = iter(s.scores())
-            next(scores)  # the note's own score
-            score_up_to_note = next(scores, None)
-
-            if score_up_to_note is None:
-                s_expr_before_note = None
-            else:
-                s_expr_before_note = play_simple_score(score_up_to_note)
-
-            deepest_node = _deepest(note_to_render)
-
-            if isinstance(deepest_node, Chord) and deepest_node.address in expanded_chords:
-                items.extend(self._ad_hoc_copy_pasta(s_expr_before_note, note_to_render, t_address, expanded_chords))
-                continue
-
-            initial_nerd_s_expr = NerdSExpr.from_s_expr(s_expr_before_note)
-
-            prefix = ICHAddress(_deepest(note_to_render).address, tuple(t_address))
-
-            nerd_s_expr = play_note(note_to_render, initial_nerd_s_expr)
-
-            # we bring the pp-annotations in the address-space of the tree that's actually being displayed by filtering
-            # on the the first part of the t-address, and dropping it.
-            rewritten_pp_annotations = [
-                type(a)(a.score, type(a.annotation)(a.annotation.t_address[len(t_address):]))
-                for a in self.tree_widget.ds.pp_annotations
-                if a.annotation.t_address[:len(t_address)] == t_address
-                ]
-            annotated_nerd_s_expr = construct_pp_nerd_tree(nerd_s_expr, rewritten_pp_annotations)
-
-            annotated_renderings = annotated_render_t0(annotated_nerd_s_expr, address=prefix)
-
-            # The return type of the render_* functions is a list of InContextDisplay items; the reasons for there to be
-            # more or less than a single return value are:
-            # 1. insertions inside deletions (no values returned);
-            # 2. set-atom: renders the pre-change and post-change states (multiple values returned)
-            # Point 1 does not apply here, because the outermost context is never deleted (true for any context: even
-            # though arbitrary nodes may be deleted, that deletion is never part of that node's history, but of its
-            # parent's history)
-            # Point 2 does apply: we render atom histories when an atom is clicked. To ensure that a single set-atom is
-            # rendered as a single item we group the results from render_t0 into a ICGrouping.
-            assert len(annotated_renderings) > 0, (
-                "An error in the human reasoning in the comment above this line (point 1)")
-
-            if len(annotated_renderings) > 1:
-                items.append(PPAnnotatedInContextDisplay(
-                    ICGrouping([a.underlying_node for a in annotated_renderings], address=prefix),
-                    annotation=PPSingleLine(),  # TBD whether this is correct
-                    children=annotated_renderings,
-                    ))
-            else:
-                items.extend(annotated_renderings)
+    def _items(self, score, local_score, t_address, expanded_chords):
+        # The items are rendered lazily, per note (see LazyItems): for a node with a long history only the notes that
+        # are actually shown are rendered. The results per note are cached by the note's score (see
+        # self._items_cache), such that an extended score (i.e. the typical case: a note was added) doesn't require
+        # re-rendering the existing notes even when they are shown.
 
-        return items
+        # we bring the pp-annotations in the address-space of the tree that's actually being displayed by taking the
+        # subtrie at t_address.
+        pp_annotations = self.tree_widget.ds.pp_annotations.at(t_address)
 
-    def _ad_hoc_copy_pasta(self, s_expr_so_far, chord_containing_node, t_address, expanded_chords):
-        # copy_pasta source: _items
-        items = []
+        # The pp-annotations are compared by identity (the trie is immutable, and unchanged subtries are shared).
+        context = (tuple(t_address), pp_annotations)
 
-        chord = _deepest(chord_containing_node)
-        rewrap = _x_deepest(chord_containing_node)
+        scores = list(reversed(list(local_score.scores())))
 
-        for inner_note in chord.score.notes:
-            note_to_render = rewrap(inner_note)
+        note_addresses = []
+        note_indices = []
+        for k, s in enumerate(scores):
+            for note_address in _item_note_addresses(s.last_note(), expanded_chords):
+                note_addresses.append(note_address)
+                note_indices.append(k)
+
+        return LazyItems(note_addresses, note_indices, partial(
+            self._items_for_kth_note, score, scores, t_address, expanded_chords, context, pp_annotations))
+
+    def _items_for_kth_note(self, score, scores, t_address, expanded_chords, context, pp_annotations, k):
+        s = scores[k]
+        note_to_render = s.last_note()
+
+        deepest_node = _deepest(note_to_render)
+        if isinstance(deepest_node, Chord) and deepest_node.address in expanded_chords:
+            # the rendering of expanded chords depends on the expansion of the chords inside them too.
+            note_context = context + (frozenset(expanded_chords),)
+        else:
+            note_context = context
+
+        cached = self._items_cache.get(s)
+        if cached is not None and cached[0] == note_context:
+            return cached[1]
+
+        note_items = self._items_for_note(
+            self._s_expr_before_kth_note(score, scores, t_address, k), note_to_render, t_address, expanded_chords,
+            pp_annotations)
+
+        self._items_cache[s] = (note_context, note_items)
+        return note_items
+
+    def _s_expr_before_kth_note(self, score, scores, t_address, k):
+        """The node (at t_address) as it was right before the k-th note in its (local) score was played.
+
+        Rather than replaying the local score up to k, we look the node up in the tree as it was before the global note
+        that the k-th note is (part of); those trees are memoized anyway (see play_score_with_global_address). A single
+        global note may account for multiple local notes (Chords); those that precede the k-th are replayed."""
+        global_index = _global_index(scores[k].last_note())
+
+        j = k
+        while j > 0 and _global_index(scores[j - 1].last_note()) == global_index:
+            j -= 1
+
+        if j == 0:
+            s_expr = None
+        else:
+            tree = play_score_with_global_address(self.m, score.ancestor(global_index))
+            s_expr = node_for_s_address(tree, get_s_address_for_t_address(tree, t_address))
 
-            deepest_node = _deepest(note_to_render)
+        for s in scores[j:k]:
+            s_expr = play_note_regularly(s.last_note(), s_expr, SimpleScore)
 
-            if isinstance(deepest_node, Chord) and deepest_node.address in expanded_chords:
-                items.extend(self._ad_hoc_copy_pasta(s_expr_so_far, note_to_render, t_address))
-                continue
+        return s_expr
 
-            initial_nerd_s_expr = NerdSExpr.from_s_expr(s_expr_so_far)
+    def _items_for_note(self, s_expr_before_note, note_to_render, t_address, expanded_chords, pp_annotations):
+        deepest_node = _deepest(note_to_render)
 
-            prefix = ICHAddress(_deepest(note_to_render).address, tuple(t_address))
+        if isinstance(deepest_node, Chord) and deepest_node.address in expanded_chords:
+            return self._ad_hoc_copy_pasta(
+                s_expr_before_note, note_to_render, t_address, expanded_chords, pp_annotations)
 
-            nerd_s_expr = play_note(note_to_render, initial_nerd_s_expr)
+        initial_nerd_s_expr = NerdSExpr.from_s_expr(s_expr_before_note)
 
-            # we bring the pp-annotations in the address-space of the tree that's actually being displayed by filtering
-            # on the the first part of the t-address, and dropping it.
-            rewritten_pp_annotations = [
-                type(a)(a.score, type(a.annotation)(a.annotation.t_address[len(t_address):]))
-                for a in self.tree_widget.ds.pp_annotations
-                if a.annotation.t_address[:len(t_address)] == t_address
-                ]
-            annotated_nerd_s_expr = construct_pp_nerd_tree(nerd_s_expr, rewritten_pp_annotations)
+        prefix = ICHAddress(deepest_node.address, tuple(t_address))
 
-            annotated_renderings = annotated_render_t0(annotated_nerd_s_expr, address=prefix)
+        nerd_s_expr = play_note(note_to_render, initial_nerd_s_expr)
 
-            # comment not copied
-            assert len(annotated_renderings) > 0, (
-                "An error in the human reasoning in the comment above this line (point 1)")
+        annotated_nerd_s_expr = construct_pp_nerd_tree(nerd_s_expr, pp_annotations)
 
-            if len(annotated_renderings) > 1:
-                items.append(PPAnnotatedInContextDisplay(
-                    ICGrouping([a.underlying_node for a in annotated_renderings], address=prefix),
-                    annotation=PPSingleLine(),  # TBD whether this is correct
-                    children=annotated_renderings,
-                    ))
-            else:
-                items.extend(annotated_renderings)
+        annotated_renderings = annotated_render_t0(annotated_nerd_s_expr, address=prefix)
+
+        # The return type of the render_* functions is a list of InContextDisplay items; the reasons for there to be
+        # more or less than a single return value are:
+        # 1. insertions inside deletions (no values returned);
+        # 2. set-atom: renders the pre-change and post-change states (multiple values returned)
+        # Point 1 does not apply here, because the outermost context is never deleted (true for any context: even
+        # though arbitrary nodes may be deleted, that deletion is never part of that node's history, but of its
+        # parent's history)
+        # Point 2 does apply: we render atom histories when an atom is clicked. To ensure that a single set-atom is
+        # rendered as a single item we group the results from render_t0 into a ICGrouping.
+        assert len(annotated_renderings) > 0, (
+            "An error in the human reasoning in the comment above this line (point 1)")
+
+        if len(annotated_renderings) > 1:
+            return [PPAnnotatedInContextDisplay(
+                ICGrouping([a.underlying_node for a in annotated_renderings], address=prefix),
+                annotation=PPSingleLine(),  # TBD whether this is correct
+                children=annotated_renderings,
+                )]
+
+        return annotated_renderings
+
+    def _ad_hoc_copy_pasta(self, s_expr_so_far, chord_containing_node, t_address, expanded_chords, pp_annotations):
+        # The items for an expanded chord: one (or more) for each note in the chord.
+        items = []
+
+        chord = _deepest(chord_containing_node)
+        rewrap = _x_deepest(chord_containing_node)
+
+        for inner_note in chord.score.notes:
+            note_to_render = rewrap(inner_note)
+
+            items.extend(
+                self._items_for_note(s_expr_so_far, note_to_render, t_address, expanded_chords, pp_annotations))
 
             s_expr_so_far = play_note_regularly(note_to_render, s_expr_so_far, SimpleScore)
 
@@ -307,7 +361,7 @@ class HistoryWidget(FocusBehavior, Widget):
     def parent_cursor_update(self, data):
         t_address = data
         local_score = self._local_score(self.ds.score, t_address)
-        items = self._items(local_score, t_address, self.ds.expanded_chords)
+        items = self._items(self.ds.score, local_score, t_address, self.ds.expanded_chords)
 
         self.ds = EICHStructure(
             self.ds.score,
@@ -328,9 +382,7 @@ class HistoryWidget(FocusBehavior, Widget):
         self.update_score(data)
 
     def _local_score(self, score, tree_t_address):
-        annotated_score = score_with_global_address(score)
-
-        tree = play_simple_score(annotated_score)
+        tree = play_score_with_global_address(self.m, score)
         s_address = get_s_address_for_t_address(tree, tree_t_address)
 
         if s_address is None:
@@ -343,12 +395,25 @@ class HistoryWidget(FocusBehavior, Widget):
 
         return cursor_node.score
 
+    def _score_in_past(self, score, tree_t_address, length):
+        # The score of the node at tree_t_address (as a Score, not as the SimpleScore of GlobNotes that _local_score
+        # returns), up to and including the length-th note. Both trees are memoized, and so is Score.ancestor (jumps),
+        # which means this doesn't grow with the length of the history.
+        tree = play_score(self.m, score)
+        s_address = get_s_address_for_t_address(tree, tree_t_address)
+
+        if s_address is None:
+            return Score.empty(score.hash_algorithm())
+
+        node_score = node_for_s_address(tree, s_address).score
+        return node_score.ancestor(min(length, len(node_score)))
+
     def update_score(self, score):
         local_score = self._local_score(score, self.ds.tree_t_address)
 
         self.ds = EICHStructure(
             score,
-            self._items(local_score, self.ds.tree_t_address, self.ds.expanded_chords),
+            self._items(score, local_score, self.ds.tree_t_address, self.ds.expanded_chords),
             self.ds.cursor,
             self.ds.tree_t_address,
             self.ds.expanded_chords,
@@ -365,24 +430,25 @@ class HistoryWidget(FocusBehavior, Widget):
 
     def _handle_eich_note(self, eich_note):
         new_cursor, new_expanded_chords, error = eich_note_play(self.ds, eich_note)
-        local_score = self._local_score(self.ds.score, self.ds.tree_t_address)
+
+        if new_expanded_chords is self.ds.expanded_chords:
+            # A cursor move: the items are unchanged.
+            items = self.ds.items
+        else:
+            local_score = self._local_score(self.ds.score, self.ds.tree_t_address)
+            items = self._items(self.ds.score, local_score, self.ds.tree_t_address, new_expanded_chords)
 
         self.ds = EICHStructure(
             self.ds.score,
-            self._items(local_score, self.ds.tree_t_address, new_expanded_chords),
+            items,
             new_cursor,
             self.ds.tree_t_address,
             new_expanded_chords,
         )
 
-        # TODO: do the below only when in leading mode (but to do so, we need to store the variable local_score as part
-        # of our state)
-        # Implemented as the quickest way to get this to work; without any regards for performance; It's also yet
-        # another piece of evidence that the split over 3 different types of scores is a bad idea. Once we rewrite it,
-        # we might instead take the approach of dropping a number of items from the top of the list, in which case the
-        # number of items to drop is `len - (new_cursor + 1)`
-        score_in_past = Score.from_list(local_score.notes()[:new_cursor + 1])
-        self.send_state(score_in_past)
+        # TODO: do the below only when in leading mode
+        # It's yet another piece of evidence that the split over 3 different types of scores is a bad idea.
+        self.send_state(self._score_in_past(self.ds.score, self.ds.tree_t_address, new_cursor + 1))
 
         self._construct_target_box_structure()
         self._update_viewport_for_change(change_source=HERE)
@@ -398,6 +464,7 @@ class HistoryWidget(FocusBehavior, Widget):
             # home.
             note = MoveViewportRelativeToCursor({'e': VIEWPORT_LINE_UP, 'y': VIEWPORT_LINE_DOWN}[textual_code])
             self.viewport_ds = play_viewport_note(note, self.viewport_ds)
+            self._ensure_viewport_is_laid_out()
             self.invalidate()
 
         elif self.z_pressed:
@@ -410,6 +477,7 @@ class HistoryWidget(FocusBehavior, Widget):
                 }
                 note = MoveViewportRelativeToCursor(lookup[textual_code])
                 self.viewport_ds = play_viewport_note(note, self.viewport_ds)
+                self._ensure_viewport_is_laid_out()
                 self.invalidate()
 
         elif textual_code in ['z']:
@@ -434,6 +502,7 @@ class HistoryWidget(FocusBehavior, Widget):
 
     def size_change(self, *args):
         self._update_viewport_for_change(change_source=ELSEWHERE)
+        self._ensure_viewport_is_laid_out()
         self.invalidate()
 
     def invalidate(self, *args):
@@ -443,7 +512,7 @@ class HistoryWidget(FocusBehavior, Widget):
         # Gets the dimensions (cursor_position, cursor_size, both as scalars). Mirrors the generic version in utils.py
         # implementation: we know that self.target_box_structure is a single NT which contains an NT for each of the
         # "lines" representing notes; we simply look up the relevant line and return its offset and dimensions.
-        o, nt = self.target_box_structure.offset_nonterminals[self.ds.cursor]
+        o, nt = self.target_box_structure.offset_nonterminals[self.ds.cursor - self.window_start]
         return o[Y], nt.outer_dimensions[Y]
 
     def _update_viewport_for_change(self, change_source):
@@ -453,7 +522,7 @@ class HistoryWidget(FocusBehavior, Widget):
         # In the below, all sizes and positions are brought into the positive integers; there is a mirroring `+` in the
         # offset calculation when we actually apply the viewport.
         context = ViewportContext(
-            document_size=self.target_box_structure.outer_dimensions[Y] * -1,
+            document_size=self.document_size,
             viewport_size=self.size[Y],
             cursor_size=cursor_size * -1,
             cursor_position=cursor_position * -1)
@@ -466,10 +535,59 @@ class HistoryWidget(FocusBehavior, Widget):
         self.target_viewport_position = self.viewport_ds.get_position()
         self.animation_time_remaining = ANIMATION_LENGTH
 
-    def _construct_target_box_structure(self):
-        offset_nonterminals = self._nts_for_items(self.ds.items)
+    def _window(self, include_viewport=False):
+        """The range of items that's actually laid out: those that may be visible (given any viewport that has the
+        cursor in it) plus a margin; optionally extended with the items in the actual viewport, which may have been
+        scrolled away from the cursor (ctrl-e/ctrl-y)."""
+        start, end = window_around_cursor(
+            self.ds.cursor, len(self.ds.items), self.size[Y], self._item_size_estimate, WINDOW_MARGIN)
+
+        if not include_viewport:
+            return start, end
+
+        # Which items are in the viewport is estimated relative to the previous layout (which is what the viewport's
+        # position is expressed in)
+        top, _ = self.window_extent
+        position = self.viewport_ds.get_position()
+        first = self.window_start + int((position - top) // self._item_size_estimate)
+        last = self.window_start + int((position + self.size[Y] - top) // self._item_size_estimate) + 1
+
+        return (max(0, min(start, first - WINDOW_MARGIN)),
+                min(len(self.ds.items), max(end, last + WINDOW_MARGIN)))
+
+    def _viewport_is_laid_out(self):
+        top, bottom = self.window_extent
+        position = self.viewport_ds.get_position()
+        return ((self.window_start == 0 or top <= position) and
+                (self.window_end == len(self.ds.items) or position + self.size[Y] <= bottom))
+
+    def _ensure_viewport_is_laid_out(self):
+        # Scrolling the viewport (or growing it) may take it past the laid out window, which would show up as blank
+        # rows. In that case we lay out again, with the window extended to the viewport (see _window).
+        if self._viewport_is_laid_out():
+            return
+
+        self._construct_target_box_structure(include_viewport=True)
+        self._update_viewport_for_change(change_source=ELSEWHERE)
+
+    def _construct_target_box_structure(self, include_viewport=False):
+        start, end = self._window(include_viewport)
+        window_nts, window_size = self._nts_for_items(self.ds.items, start, end)
+
+        # The size of the items outside the window is estimated based on those inside it.
+        size_before = estimated_size(window_size, end - start, start)
+        size_after = estimated_size(window_size, end - start, len(self.ds.items) - end)
+
+        if end > start:
+            self._item_size_estimate = max(1, window_size / (end - start))
+
+        offset_nonterminals = [OffsetBox((o[X], o[Y] - size_before), nt) for (o, nt) in window_nts]
         root_nt = BoxNonTerminal(offset_nonterminals, [])
 
+        self.window_start, self.window_end = start, end
+        self.window_extent = (size_before, size_before + window_size)
+        self.document_size = size_before + window_size + size_after
+
         self.target_box_structure = root_nt
 
         self.target = flatten_nt_to_dict(root_nt, (0, 0))
@@ -513,11 +631,13 @@ class HistoryWidget(FocusBehavior, Widget):
             return WHITE, result[0]
         return result
 
-    def _nts_for_items(self, items):
+    def _nts_for_items(self, items, start, end):
+        """Lays out items[start:end]; returns the offset boxes (starting at 0) and the (positive) size they take."""
         result = []
         offset_y = 0
 
-        for i, annotated_rendering in enumerate(items):
+        for i in range(start, end):
+            annotated_rendering = items[i]
             algebra = partial(self._nt_for_iri, i)
 
             iri_annotated_node = construct_iri_top_down(
@@ -533,10 +653,9 @@ class HistoryWidget(FocusBehavior, Widget):
 
             result.append(OffsetBox((0, offset_y), per_step_result))
 
-            INTER_ITEM_MARGIN = 20
             offset_y += per_step_result.outer_dimensions[Y] - INTER_ITEM_MARGIN
 
-        return result
+        return result, offset_y * -1
 
     def _nt_for_iri(self, index_in_items, iri_annotated_node, children_nts):
         pmts(iri_annotated_node, IriAnnotatedInContextDisplay)
@@ -814,10 +933,11 @@ class HistoryWidget(FocusBehavior, Widget):
         # Given a point, determine what was clicked; Mirrors the generic version in utils.py. Differences:
         # * we simply iterate over the top-level items only.
         # * y-based only (we don't check x coordinates at all)
+        # * only the items in the window are laid out (see _window), hence the translation to an index in self.ds.items
 
         for i, (o, nt) in enumerate(self.target_box_structure.offset_nonterminals):
             if o[Y] >= point[Y] >= o[Y] + nt.outer_dimensions[Y]:  # '>=' rather than '<=': kivy's origin is bottom-left
-                return i
+                return self.window_start + i
 
         return None
 
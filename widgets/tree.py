@@ -33,6 +33,7 @@ from dsn.editor.structure import EditStructure
 
 from dsn.pp.clef import PPUnset, PPSetSingleLine, PPSetMultiLineAligned, PPSetMultiLineIndented
 from dsn.pp.construct import construct_pp_tree
+from dsn.pp.structure import PPAnnotationTrie
 from dsn.pp.in_context import (
     construct_iri_top_down,
     InheritedRenderingInformation,
@@ -46,7 +47,7 @@ from spacetime import t_address_for_s_address, best_s_address_for_t_address, get
 
 from dsn.s_expr.clef import Note
 from dsn.s_expr.structure import Atom, List
-from dsn.s_expr.construct import play_score
+from dsn.s_expr.construct import play_score, apply_note, COLD_REPLAY_MEMOIZE_EVERY
 from dsn.s_expr.score import Score
 from dsn.s_expr.utils import bubble_history_up
 
@@ -152,7 +153,7 @@ class TreeWidget(FocusBehavior, Widget):
         # to be filled "immediately" after __init__, by some notes flowing in over the connected channels.
         # As an implication of this, some of the tree-dependent datastructures are in an initally-uninitialized state
         # too, e.g. viewport_ds has meaningful ViewportContext, because we don't know it yet
-        self.ds = EditStructure(None, [], [], None)
+        self.ds = EditStructure(None, [], PPAnnotationTrie(), None)
         self.vim_ds = None
 
         # at some point, we should generalize over "next keypress handlers" such as vim_ds & z_pressed
@@ -186,12 +187,14 @@ class TreeWidget(FocusBehavior, Widget):
         pmts(data, Score)
 
         t_cursor = t_address_for_s_address(self.ds.tree, self.ds.s_cursor)
-        new_tree = play_score(self.m, data)
+
+        # Scores from the channel may be far ahead of what we've seen so far (e.g. the initial score on startup)
+        new_tree = play_score(self.m, data, memoize_every=COLD_REPLAY_MEMOIZE_EVERY)
 
         # refetching the s_cursor via t_cursor ensures the current cursor is unaffected by changes in other windows.
         s_cursor = best_s_address_for_t_address(new_tree, t_cursor)
 
-        self._update_internal_state_for_score(data, s_cursor, ELSEWHERE)
+        self._update_internal_state_for_tree(new_tree, s_cursor, ELSEWHERE)
 
     def channel_closed(self):
         self.closed = True
@@ -218,12 +221,13 @@ class TreeWidget(FocusBehavior, Widget):
         # in nerf0 bubble_history_up simply looked at the root_node and created an actuality out of that node's
         # nout_hash and any new information.
 
-        score = self.ds.tree.score
+        # We have the tree that the notes apply to in hand; i.e. there's no need to look up (or replay) any history.
+        tree = self.ds.tree
         for note in not_quite_score:
             self.send_to_channel(note)
-            score = score.slur(note)
+            tree = apply_note(self.m, tree, note)
 
-        self._update_internal_state_for_score(score, new_s_cursor, change_source=HERE)
+        self._update_internal_state_for_tree(tree, new_s_cursor, change_source=HERE)
 
     def _handle_selection_note(self, selection_note):
         self.selection_ds = selection_note_play(selection_note, self.selection_ds)
@@ -245,14 +249,12 @@ class TreeWidget(FocusBehavior, Widget):
         # selection_note_play which needs not be followed by handling of state-changes to the wrapped main structure.
         self.selection_ds = selection_note_play(SelectionContextChange(self.ds), self.selection_ds)
 
-    def _update_internal_state_for_score(self, score, new_s_cursor, change_source):
-        new_tree = play_score(self.m, score)
-
+    def _update_internal_state_for_tree(self, new_tree, new_s_cursor, change_source):
         self.ds = EditStructure(
             new_tree,
             new_s_cursor,
-            self.ds.pp_annotations[:],
-            construct_pp_tree(new_tree, self.ds.pp_annotations)
+            self.ds.pp_annotations,
+            construct_pp_tree(new_tree, self.ds.pp_annotations, self.ds.pp_tree, self.ds.pp_annotations)
         )
 
         self._update_selection_ds_for_main_ds()
@@ -368,13 +370,13 @@ class TreeWidget(FocusBehavior, Widget):
         elif textual_code in ['-']:
             # quick & dirty all-around
             set_font_size(get_font_size() - 1)
-            self.m.texture_for_text = {}
+            self.m.texture_for_text.clear()
             self.invalidate()
 
         elif textual_code in ['+']:
             # quick & dirty all-around
             set_font_size(get_font_size() + 1)
-            self.m.texture_for_text = {}
+            self.m.texture_for_text.clear()
             self.invalidate()
 
         elif textual_code in ['left', 'h']:
@@ -512,9 +514,9 @@ class TreeWidget(FocusBehavior, Widget):
         pp_note = pp_note_type(t_address)
         annotation = Annotation(self.ds.tree.score, pp_note)
 
-        pp_annotations = self.ds.pp_annotations[:] + [annotation]
+        pp_annotations = self.ds.pp_annotations.with_annotation(annotation)
 
-        pp_tree = construct_pp_tree(self.ds.tree, pp_annotations)
+        pp_tree = construct_pp_tree(self.ds.tree, pp_annotations, self.ds.pp_tree, self.ds.pp_annotations)
 
         self.ds = EditStructure(
             self.ds.tree,
@@ -557,9 +559,9 @@ class TreeWidget(FocusBehavior, Widget):
             # NERF-1 worry: in nerf0 we communicated over the child channel using "any nout_hash", i.e. potentially a
             # full new history. Here we assume note-by-note instead (which implies: history is consecutive). The worry
             # is: this only works if the child channel faithfully communicates all notes in order.
-            score = self.ds.tree.score.slur(note)
+            new_tree = apply_note(self.m, self.ds.tree, note)
 
-            self._update_internal_state_for_score(score, self.ds.s_cursor, change_source=ELSEWHERE)
+            self._update_internal_state_for_tree(new_tree, self.ds.s_cursor, change_source=ELSEWHERE)
 
         def receive_close_from_child():
             del self.notify_children[channel_id]